@@ -0,0 +1,126 @@
+from sqlalchemy import Table, inspect, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.schema import CreateIndex, CreateTable
+from app.database.database import Base
+
+# Tabelas que ganharam a coluna de versão (ETag/If-Match)
+TABELAS_VERSIONADAS = ["formulario", "pergunta", "opcoes_respostas"]
+
+def atualizar_esquema(engine: Engine) -> None:
+    """Ajustar bancos criados antes das colunas de versão e do ON DELETE CASCADE.
+
+    O ``create_all`` só cria tabelas que não existem; aqui as tabelas antigas
+    recebem a coluna ``versao`` e as chaves estrangeiras passam a ter
+    ON DELETE CASCADE, do qual as exclusões dependem. No PostgreSQL as
+    constraints são recriadas; o SQLite não altera constraints, então as
+    tabelas desatualizadas são reconstruídas.
+    """
+    inspetor = inspect(engine)
+    with engine.begin() as conexao:
+        for tabela in TABELAS_VERSIONADAS:
+            colunas = {coluna["name"] for coluna in inspetor.get_columns(tabela)}
+            if "versao" not in colunas:
+                conexao.execute(text(f"ALTER TABLE {tabela} ADD COLUMN versao INTEGER NOT NULL DEFAULT 1"))
+
+        if engine.dialect.name == "postgresql":
+            _recriar_chaves_estrangeiras(conexao, inspetor)
+
+    if engine.dialect.name == "sqlite":
+        with engine.connect() as conexao:
+            desatualizadas = [
+                tabela for tabela in Base.metadata.sorted_tables
+                if _tabela_sqlite_desatualizada(conexao, tabela)
+            ]
+        if desatualizadas:
+            _reconstruir_tabelas_sqlite(engine, desatualizadas)
+
+def _recriar_chaves_estrangeiras(conexao: Connection, inspetor) -> None:
+    for tabela in Base.metadata.sorted_tables:
+        existentes = inspetor.get_foreign_keys(tabela.name)
+        for constraint in tabela.foreign_key_constraints:
+            if constraint.ondelete != "CASCADE":
+                continue
+            colunas = [coluna.name for coluna in constraint.columns]
+            for fk in existentes:
+                if fk["constrained_columns"] != colunas:
+                    continue
+                if (fk["options"].get("ondelete") or "").upper() == "CASCADE":
+                    continue
+                referencia = constraint.elements[0].column.table.name
+                colunas_referencia = [elemento.column.name for elemento in constraint.elements]
+                conexao.execute(text(
+                    f'ALTER TABLE {tabela.name} DROP CONSTRAINT "{fk["name"]}", '
+                    f'ADD CONSTRAINT "{fk["name"]}" FOREIGN KEY ({", ".join(colunas)}) '
+                    f'REFERENCES {referencia} ({", ".join(colunas_referencia)}) ON DELETE CASCADE'
+                ))
+
+def _tabela_sqlite_desatualizada(conexao: Connection, tabela: Table) -> bool:
+    """Verificar se a tabela existente difere do modelo em cascata ou AUTOINCREMENT"""
+    definicao = conexao.execute(
+        text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :nome"), {"nome": tabela.name}
+    ).scalar()
+    if definicao is None:
+        return False
+    if tabela.dialect_options["sqlite"]["autoincrement"] and "AUTOINCREMENT" not in definicao.upper():
+        return True
+
+    # O inspetor do SQLite não informa o ON DELETE; o pragma informa
+    cascatas = {
+        linha._mapping["from"]
+        for linha in conexao.execute(text(f"PRAGMA foreign_key_list({tabela.name})"))
+        if linha.on_delete.upper() == "CASCADE"
+    }
+    return any(
+        constraint.ondelete == "CASCADE" and coluna.name not in cascatas
+        for constraint in tabela.foreign_key_constraints
+        for coluna in constraint.columns
+    )
+
+def _reconstruir_tabelas_sqlite(engine: Engine, tabelas: list) -> None:
+    """Reconstruir tabelas no SQLite: criar a nova, copiar os dados e renomear.
+
+    Segue o procedimento da documentação do SQLite para mudanças que o
+    ALTER TABLE não suporta: chaves estrangeiras desligadas durante a troca,
+    tudo em uma transação e ``foreign_key_check`` antes do commit.
+    """
+    bruta = engine.raw_connection()
+    conexao = bruta.driver_connection
+    isolamento = conexao.isolation_level
+    # Modo autocommit do driver: o BEGIN/COMMIT abaixo é explícito, e o pragma
+    # de chaves estrangeiras não tem efeito dentro de uma transação
+    conexao.isolation_level = None
+    cursor = conexao.cursor()
+    chaves_estrangeiras = cursor.execute("PRAGMA foreign_keys").fetchone()[0]
+    try:
+        cursor.execute("PRAGMA foreign_keys=OFF")
+        cursor.execute("BEGIN")
+        try:
+            for tabela in tabelas:
+                temporaria = f"{tabela.name}_migracao"
+                criacao = str(CreateTable(tabela).compile(dialect=engine.dialect))
+                cursor.execute(criacao.replace(f"CREATE TABLE {tabela.name} (", f"CREATE TABLE {temporaria} (", 1))
+
+                existentes = {linha[1] for linha in cursor.execute(f"PRAGMA table_info({tabela.name})").fetchall()}
+                colunas = ", ".join(coluna.name for coluna in tabela.columns if coluna.name in existentes)
+                cursor.execute(f"INSERT INTO {temporaria} ({colunas}) SELECT {colunas} FROM {tabela.name}")
+                cursor.execute(f"DROP TABLE {tabela.name}")
+                cursor.execute(f"ALTER TABLE {temporaria} RENAME TO {tabela.name}")
+                for indice in tabela.indexes:
+                    cursor.execute(str(CreateIndex(indice).compile(dialect=engine.dialect)))
+
+            # Linhas órfãs deixadas pelo esquema antigo impediriam as exclusões em cascata
+            orfas = cursor.execute("PRAGMA foreign_key_check").fetchall()
+            if orfas:
+                raise RuntimeError(
+                    f"Não foi possível migrar o banco: {len(orfas)} registros apontam para pais inexistentes "
+                    f"(tabelas: {', '.join(sorted({linha[0] for linha in orfas}))})"
+                )
+            cursor.execute("COMMIT")
+        except Exception:
+            cursor.execute("ROLLBACK")
+            raise
+    finally:
+        cursor.execute(f"PRAGMA foreign_keys={'ON' if chaves_estrangeiras else 'OFF'}")
+        cursor.close()
+        conexao.isolation_level = isolamento
+        bruta.close()
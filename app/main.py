@@ -1,15 +1,28 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.database.database import engine, Base
-from app.routers import formularios, perguntas, opcoes_respostas
+from app.database.migracoes import atualizar_esquema
+from app.routers import formularios, perguntas, opcoes_respostas, alteracoes
+from app.services.alteracoes import compactar_periodicamente
 
 # Criar as tabelas no banco de dados
 Base.metadata.create_all(bind=engine)
+atualizar_esquema(engine)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Compactação periódica do feed de alterações
+    compactacao = asyncio.create_task(compactar_periodicamente())
+    yield
+    compactacao.cancel()
 
 app = FastAPI(
     title="API de Formulários Dinâmicos",
     description="API para gerenciamento de formulários dinâmicos com perguntas cadastradas pelos usuários",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Configurar CORS
@@ -25,6 +38,7 @@ app.add_middleware(
 app.include_router(formularios.router)
 app.include_router(perguntas.router)
 app.include_router(opcoes_respostas.router)
+app.include_router(alteracoes.router)
 
 @app.get("/")
 def read_root():
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, Enum
+from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, Enum, DateTime, JSON, func
 from sqlalchemy.orm import relationship
 from app.database.database import Base
 import enum
@@ -13,20 +13,25 @@ class TipoPerguntaEnum(str, enum.Enum):
 
 class Formulario(Base):
     __tablename__ = "formulario"
+    # Ids nunca são reaproveitados, nem no SQLite: o feed identifica entidades pelo id
+    __table_args__ = {"sqlite_autoincrement": True}
     
     id = Column(Integer, primary_key=True, index=True)
     titulo = Column(String, nullable=False)
     descricao = Column(String)
     ordem = Column(Integer)
+    # Incrementada a cada atualização; usada no ETag/If-Match
+    versao = Column(Integer, nullable=False, default=1, server_default="1")
     
     # Relacionamento com perguntas
-    perguntas = relationship("Pergunta", back_populates="formulario", cascade="all, delete-orphan")
+    perguntas = relationship("Pergunta", back_populates="formulario", cascade="all, delete-orphan", passive_deletes=True)
 
 class Pergunta(Base):
     __tablename__ = "pergunta"
+    __table_args__ = {"sqlite_autoincrement": True}
     
     id = Column(Integer, primary_key=True, index=True)
-    id_formulario = Column(Integer, ForeignKey("formulario.id"), nullable=False)
+    id_formulario = Column(Integer, ForeignKey("formulario.id", ondelete="CASCADE"), nullable=False)
     titulo = Column(String, nullable=False)
     codigo = Column(String)
     orientacao_resposta = Column(String)
@@ -34,33 +39,59 @@ class Pergunta(Base):
     obrigatoria = Column(Boolean, default=False)
     sub_pergunta = Column(Boolean, default=False)
     tipo_pergunta = Column(Enum(TipoPerguntaEnum), nullable=False)
+    versao = Column(Integer, nullable=False, default=1, server_default="1")
     
     # Relacionamentos
     formulario = relationship("Formulario", back_populates="perguntas")
-    opcoes_respostas = relationship("OpcoesRespostas", back_populates="pergunta", cascade="all, delete-orphan")
-    opcoes_resposta_pergunta = relationship("OpcoesRespostaPergunta", back_populates="pergunta", cascade="all, delete-orphan")
+    opcoes_respostas = relationship("OpcoesRespostas", back_populates="pergunta", cascade="all, delete-orphan", passive_deletes=True)
+    opcoes_resposta_pergunta = relationship("OpcoesRespostaPergunta", back_populates="pergunta", cascade="all, delete-orphan", passive_deletes=True)
 
 class OpcoesRespostas(Base):
     __tablename__ = "opcoes_respostas"
+    __table_args__ = {"sqlite_autoincrement": True}
     
     id = Column(Integer, primary_key=True, index=True)
-    id_pergunta = Column(Integer, ForeignKey("pergunta.id"), nullable=False)
+    id_pergunta = Column(Integer, ForeignKey("pergunta.id", ondelete="CASCADE"), nullable=False)
     resposta = Column(String, nullable=False)
     ordem = Column(Integer)
     resposta_aberta = Column(Boolean, default=False)
+    versao = Column(Integer, nullable=False, default=1, server_default="1")
     
     # Relacionamentos
     pergunta = relationship("Pergunta", back_populates="opcoes_respostas")
-    opcoes_resposta_pergunta = relationship("OpcoesRespostaPergunta", back_populates="opcao_resposta", cascade="all, delete-orphan")
+    opcoes_resposta_pergunta = relationship("OpcoesRespostaPergunta", back_populates="opcao_resposta", cascade="all, delete-orphan", passive_deletes=True)
 
 class OpcoesRespostaPergunta(Base):
     __tablename__ = "opcoes_resposta_pergunta"
+    __table_args__ = {"sqlite_autoincrement": True}
     
     id = Column(Integer, primary_key=True, index=True)
-    id_opcao_resposta = Column(Integer, ForeignKey("opcoes_respostas.id"), nullable=False)
-    id_pergunta = Column(Integer, ForeignKey("pergunta.id"), nullable=False)
+    id_opcao_resposta = Column(Integer, ForeignKey("opcoes_respostas.id", ondelete="CASCADE"), nullable=False)
+    id_pergunta = Column(Integer, ForeignKey("pergunta.id", ondelete="CASCADE"), nullable=False)
     
     # Relacionamentos
     opcao_resposta = relationship("OpcoesRespostas", back_populates="opcoes_resposta_pergunta")
     pergunta = relationship("Pergunta", back_populates="opcoes_resposta_pergunta")
 
+
+class Alteracao(Base):
+    __tablename__ = "alteracoes"
+    __table_args__ = {"sqlite_autoincrement": True}
+    
+    # Sequência monotônica usada pelos clientes como cursor (?desde=<seq>)
+    seq = Column(Integer, primary_key=True, index=True)
+    entidade = Column(String, nullable=False)
+    id_entidade = Column(Integer, nullable=False, index=True)
+    operacao = Column(String, nullable=False)
+    dados = Column(JSON)
+    criado_em = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+class CompactacaoAlteracoes(Base):
+    __tablename__ = "compactacoes_alteracoes"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    # Exclusões até este seq foram expurgadas: clientes com cursor anterior
+    # precisam sincronizar de novo a partir do zero
+    horizonte_seq = Column(Integer, nullable=False)
+    removidas = Column(Integer, nullable=False)
+    executada_em = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
@@ -0,0 +1,196 @@
+import asyncio
+import json
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+from typing import List, Optional, Set
+from app.database.database import SessionLocal, get_db
+from app.schemas.schemas import AlteracaoResponse, AlteracoesResponse
+from app.services.alteracoes import horizonte_seq, listar_alteracoes, ultimo_seq
+
+router = APIRouter(prefix="/alteracoes", tags=["alteracoes"])
+
+# Intervalo entre as consultas ao feed enquanto há streams SSE abertos
+INTERVALO_STREAM_SEGUNDOS = 1.0
+# Envia um comentário SSE a cada N intervalos sem alterações para manter a conexão viva
+CONSULTAS_POR_KEEP_ALIVE = 15
+LIMITE_STREAM = 500
+# Alterações enfileiradas por stream antes de ele precisar reler do banco
+TAMANHO_FILA_STREAM = 1000
+
+def _verificar_horizonte(horizonte: int, desde: int):
+    # Exclusões anteriores ao horizonte foram expurgadas pela compactação:
+    # um cliente parado antes dele não teria como saber o que foi removido
+    if 0 < desde < horizonte:
+        raise HTTPException(
+            status_code=status.HTTP_410_GONE,
+            detail="Histórico compactado: sincronize novamente a partir de desde=0"
+        )
+
+@router.get("/", response_model=AlteracoesResponse)
+def listar_alteracoes_desde(
+    desde: int = Query(0, ge=0, description="Retornar alterações com seq maior que este valor"),
+    limite: int = Query(100, ge=1, le=1000, description="Quantidade máxima de alterações"),
+    db: Session = Depends(get_db)
+):
+    """Listar as alterações feitas desde um seq, para sincronização incremental"""
+    _verificar_horizonte(horizonte_seq(db), desde)
+    
+    # Busca um item a mais para saber se ainda há alterações pendentes
+    alteracoes = listar_alteracoes(db, desde, limite + 1)
+    has_more = len(alteracoes) > limite
+    alteracoes = alteracoes[:limite]
+    
+    return {
+        "items": alteracoes,
+        "ultimo_seq": alteracoes[-1].seq if alteracoes else desde,
+        "has_more": has_more
+    }
+
+def _buscar_horizonte() -> int:
+    db = SessionLocal()
+    try:
+        return horizonte_seq(db)
+    finally:
+        db.close()
+
+def _buscar_ultimo_seq() -> int:
+    db = SessionLocal()
+    try:
+        return ultimo_seq(db)
+    finally:
+        db.close()
+
+def _buscar_alteracoes(desde: int) -> List[dict]:
+    db = SessionLocal()
+    try:
+        return [
+            AlteracaoResponse.model_validate(alteracao).model_dump(mode="json")
+            for alteracao in listar_alteracoes(db, desde, LIMITE_STREAM)
+        ]
+    finally:
+        db.close()
+
+class Assinatura:
+    """Fila de alterações de um stream SSE aberto"""
+
+    def __init__(self):
+        self.fila: asyncio.Queue = asyncio.Queue(maxsize=TAMANHO_FILA_STREAM)
+        # Marcada quando a fila enche: o stream descarta a fila e relê do banco
+        self.atrasada = False
+
+    def entregar(self, alteracoes: List[dict]):
+        for alteracao in alteracoes:
+            try:
+                self.fila.put_nowait(alteracao)
+            except asyncio.QueueFull:
+                self.atrasada = True
+                return
+
+    def descartar_pendentes(self):
+        self.atrasada = False
+        while not self.fila.empty():
+            self.fila.get_nowait()
+
+class DistribuidorAlteracoes:
+    """Consultar o feed uma vez por intervalo e repassar a todos os streams abertos.
+
+    Sem isso cada cliente SSE faria a própria consulta por segundo. A tarefa
+    de consulta só roda enquanto houver assinaturas.
+    """
+
+    def __init__(self):
+        self.assinaturas: Set[Assinatura] = set()
+        self.tarefa: Optional[asyncio.Task] = None
+        self.iniciada: Optional[asyncio.Future] = None
+
+    async def assinar(self) -> Assinatura:
+        assinatura = Assinatura()
+        self.assinaturas.add(assinatura)
+        if self.tarefa is None or self.tarefa.done():
+            self.iniciada = asyncio.get_running_loop().create_future()
+            self.tarefa = asyncio.create_task(self._consultar(self.iniciada))
+        # Só retorna depois que o cursor da consulta foi lido: o que o stream
+        # buscar no banco a seguir cobre tudo o que veio antes dele
+        await asyncio.shield(self.iniciada)
+        return assinatura
+
+    def cancelar(self, assinatura: Assinatura):
+        self.assinaturas.discard(assinatura)
+
+    async def _consultar(self, iniciada: asyncio.Future):
+        try:
+            cursor = await run_in_threadpool(_buscar_ultimo_seq)
+        except Exception as erro:
+            iniciada.set_exception(erro)
+            return
+        iniciada.set_result(None)
+        
+        while self.assinaturas:
+            alteracoes = await run_in_threadpool(_buscar_alteracoes, cursor)
+            if alteracoes:
+                cursor = alteracoes[-1]["seq"]
+                for assinatura in list(self.assinaturas):
+                    assinatura.entregar(alteracoes)
+            if len(alteracoes) < LIMITE_STREAM:
+                await asyncio.sleep(INTERVALO_STREAM_SEGUNDOS)
+
+distribuidor = DistribuidorAlteracoes()
+
+@router.get("/stream")
+async def stream_alteracoes(
+    request: Request,
+    desde: int = Query(0, ge=0, description="Enviar alterações com seq maior que este valor"),
+    last_event_id: Optional[str] = Header(None)
+):
+    """Enviar as alterações em tempo real via Server-Sent Events"""
+    # Na reconexão o navegador envia o último id recebido
+    if last_event_id and last_event_id.isdigit():
+        desde = max(desde, int(last_event_id))
+    _verificar_horizonte(await run_in_threadpool(_buscar_horizonte), desde)
+    
+    async def eventos():
+        assinatura = await distribuidor.assinar()
+        cursor = desde
+        # Primeiro busca no banco o que é anterior à assinatura; depois só
+        # consome a fila, a não ser que ela tenha transbordado
+        buscar_no_banco = True
+        consultas_vazias = 0
+        try:
+            while not await request.is_disconnected():
+                if buscar_no_banco or assinatura.atrasada:
+                    assinatura.descartar_pendentes()
+                    alteracoes = await run_in_threadpool(_buscar_alteracoes, cursor)
+                    buscar_no_banco = len(alteracoes) == LIMITE_STREAM
+                else:
+                    try:
+                        alteracoes = [
+                            await asyncio.wait_for(assinatura.fila.get(), INTERVALO_STREAM_SEGUNDOS)
+                        ]
+                    except asyncio.TimeoutError:
+                        alteracoes = []
+                    while not assinatura.fila.empty():
+                        alteracoes.append(assinatura.fila.get_nowait())
+                
+                # A fila pode repetir o que já veio do banco
+                novas = [alteracao for alteracao in alteracoes if alteracao["seq"] > cursor]
+                for alteracao in novas:
+                    cursor = alteracao["seq"]
+                    yield f"id: {cursor}\nevent: alteracao\ndata: {json.dumps(alteracao)}\n\n"
+                
+                if novas:
+                    consultas_vazias = 0
+                elif not buscar_no_banco:
+                    consultas_vazias += 1
+                    if consultas_vazias >= CONSULTAS_POR_KEEP_ALIVE:
+                        consultas_vazias = 0
+                        yield ": keep-alive\n\n"
+        finally:
+            distribuidor.cancelar(assinatura)
+    
+    return StreamingResponse(
+        eventos(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -1,24 +1,40 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, Header, HTTPException, Response, status
+from sqlalchemy import delete, insert, update
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy.orm.attributes import set_committed_value
+from typing import List, Optional
 from app.database.database import get_db
-from app.models.models import Formulario
+from app.models.models import Formulario, Pergunta
 from app.schemas.schemas import (
     FormularioCreate, 
     FormularioUpdate, 
     FormularioResponse, 
-    FormularioSimpleResponse
+    FormularioSimpleResponse,
+    FormularioArvore,
+    ArvoreAlteracoesResponse,
+    EntidadeAlteracaoEnum,
+    OperacaoAlteracaoEnum
 )
+from app.services.alteracoes import registrar_alteracao
+from app.services.arvore import aplicar_arvore, carregar_arvore
+from app.services.escrita import erro_sem_linha, erro_versao_desatualizada, etag, versao_if_match
 
 router = APIRouter(prefix="/formularios", tags=["formularios"])
 
 @router.post("/", response_model=FormularioResponse, status_code=status.HTTP_201_CREATED)
-def criar_formulario(formulario: FormularioCreate, db: Session = Depends(get_db)):
+def criar_formulario(formulario: FormularioCreate, response: Response, db: Session = Depends(get_db)):
     """Criar um novo formulário"""
-    db_formulario = Formulario(**formulario.model_dump())
-    db.add(db_formulario)
+    db_formulario = db.execute(
+        insert(Formulario).values(**formulario.model_dump()).returning(Formulario)
+    ).scalar_one()
+    # Um formulário recém-criado não tem perguntas: evita o SELECT do lazy load
+    set_committed_value(db_formulario, "perguntas", [])
+    registrar_alteracao(
+        db, EntidadeAlteracaoEnum.FORMULARIO, OperacaoAlteracaoEnum.CRIAR, db_formulario.id,
+        FormularioSimpleResponse.model_validate(db_formulario).model_dump(mode="json")
+    )
     db.commit()
-    db.refresh(db_formulario)
+    response.headers["ETag"] = etag(db_formulario.versao)
     return db_formulario
 
 @router.get("/", response_model=List[FormularioSimpleResponse])
@@ -28,7 +44,7 @@ def listar_formularios(db: Session = Depends(get_db)):
     return formularios
 
 @router.get("/{formulario_id}", response_model=FormularioResponse)
-def obter_formulario(formulario_id: int, db: Session = Depends(get_db)):
+def obter_formulario(formulario_id: int, response: Response, db: Session = Depends(get_db)):
     """Obter um formulário específico por ID"""
     formulario = db.query(Formulario).filter(Formulario.id == formulario_id).first()
     if not formulario:
@@ -36,41 +52,98 @@ def obter_formulario(formulario_id: int, db: Session = Depends(get_db)):
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Formulário não encontrado"
         )
+    response.headers["ETag"] = etag(formulario.versao)
     return formulario
 
 @router.put("/{formulario_id}", response_model=FormularioResponse)
 def atualizar_formulario(
     formulario_id: int, 
     formulario_update: FormularioUpdate, 
+    response: Response,
+    if_match: Optional[str] = Header(None),
     db: Session = Depends(get_db)
 ):
     """Atualizar um formulário existente"""
-    formulario = db.query(Formulario).filter(Formulario.id == formulario_id).first()
-    if not formulario:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Formulário não encontrado"
-        )
-    
+    versao = versao_if_match(if_match)
     update_data = formulario_update.model_dump(exclude_unset=True)
-    for field, value in update_data.items():
-        setattr(formulario, field, value)
     
-    db.commit()
-    db.refresh(formulario)
+    if not update_data:
+        # Nada a gravar: apenas confere existência e versão
+        formulario = db.get(
+            Formulario, formulario_id,
+            options=[selectinload(Formulario.perguntas).selectinload(Pergunta.opcoes_respostas)]
+        )
+        if not formulario:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Formulário não encontrado"
+            )
+        if versao is not None and formulario.versao != versao:
+            raise erro_versao_desatualizada()
+    else:
+        query = update(Formulario).where(Formulario.id == formulario_id)
+        if versao is not None:
+            query = query.where(Formulario.versao == versao)
+        # Perguntas e opções da resposta vêm em um SELECT por nível, sem lazy load
+        formulario = db.execute(
+            query.values(**update_data, versao=Formulario.versao + 1)
+            .returning(Formulario)
+            .options(selectinload(Formulario.perguntas).selectinload(Pergunta.opcoes_respostas))
+        ).scalar_one_or_none()
+        if formulario is None:
+            raise erro_sem_linha(db, Formulario, formulario_id, versao, "Formulário não encontrado")
+        
+        registrar_alteracao(
+            db, EntidadeAlteracaoEnum.FORMULARIO, OperacaoAlteracaoEnum.ATUALIZAR, formulario.id,
+            FormularioSimpleResponse.model_validate(formulario).model_dump(mode="json")
+        )
+        db.commit()
+    
+    response.headers["ETag"] = etag(formulario.versao)
     return formulario
 
 @router.delete("/{formulario_id}", status_code=status.HTTP_204_NO_CONTENT)
-def deletar_formulario(formulario_id: int, db: Session = Depends(get_db)):
+def deletar_formulario(
+    formulario_id: int,
+    if_match: Optional[str] = Header(None),
+    db: Session = Depends(get_db)
+):
     """Deletar um formulário"""
-    formulario = db.query(Formulario).filter(Formulario.id == formulario_id).first()
-    if not formulario:
+    versao = versao_if_match(if_match)
+    query = delete(Formulario).where(Formulario.id == formulario_id)
+    if versao is not None:
+        query = query.where(Formulario.versao == versao)
+    
+    # Perguntas e opções são removidas pelo ON DELETE CASCADE do banco
+    if db.execute(query.returning(Formulario.id)).scalar_one_or_none() is None:
+        raise erro_sem_linha(db, Formulario, formulario_id, versao, "Formulário não encontrado")
+    
+    # Perguntas e opções removidas em cascata não geram entradas próprias:
+    # o cliente remove os filhos ao aplicar a exclusão do formulário
+    registrar_alteracao(db, EntidadeAlteracaoEnum.FORMULARIO, OperacaoAlteracaoEnum.DELETAR, formulario_id)
+    db.commit()
+    return None
+
+@router.patch("/{formulario_id}/arvore", response_model=ArvoreAlteracoesResponse)
+def atualizar_arvore_formulario(
+    formulario_id: int,
+    arvore: FormularioArvore,
+    response: Response,
+    if_match: Optional[str] = Header(None),
+    db: Session = Depends(get_db)
+):
+    """Salvar o formulário inteiro, gravando apenas o que mudou em uma única transação"""
+    versao = versao_if_match(if_match)
+    armazenada = carregar_arvore(db, formulario_id)
+    if armazenada is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Formulário não encontrado"
         )
+    if versao is not None and armazenada.formulario.versao != versao:
+        raise erro_versao_desatualizada()
     
-    db.delete(formulario)
+    resultado = aplicar_arvore(db, armazenada, arvore)
     db.commit()
-    return None
-
+    response.headers["ETag"] = etag(resultado["versao"])
+    return resultado
@@ -1,31 +1,66 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, Header, HTTPException, Response, status
+from sqlalchemy import delete, insert, update
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 from app.database.database import get_db
 from app.models.models import OpcoesRespostas, Pergunta
 from app.schemas.schemas import (
     OpcoesRespostasCreate, 
     OpcoesRespostasUpdate, 
-    OpcoesRespostasResponse
+    OpcoesRespostasResponse,
+    EntidadeAlteracaoEnum,
+    OperacaoAlteracaoEnum
+)
+from app.services.alteracoes import registrar_alteracoes
+from app.services.escrita import (
+    eh_violacao_fk,
+    erro_sem_linha,
+    erro_versao_desatualizada,
+    etag,
+    formulario_da_opcao,
+    formulario_da_pergunta,
+    incrementar_versao_formulario,
+    versao_if_match
 )
 
 router = APIRouter(prefix="/opcoes-respostas", tags=["opcoes-respostas"])
 
 @router.post("/", response_model=OpcoesRespostasResponse, status_code=status.HTTP_201_CREATED)
-def criar_opcao_resposta(opcao: OpcoesRespostasCreate, db: Session = Depends(get_db)):
+def criar_opcao_resposta(opcao: OpcoesRespostasCreate, response: Response, db: Session = Depends(get_db)):
     """Criar uma nova opção de resposta"""
-    # Verificar se a pergunta existe
-    pergunta = db.query(Pergunta).filter(Pergunta.id == opcao.id_pergunta).first()
-    if not pergunta:
+    # Trava o formulário antes da opção, a ordem de bloqueio de todas as
+    # escritas; sem linha atualizada, a pergunta não existe
+    alteracao_formulario = incrementar_versao_formulario(db, formulario_da_pergunta(opcao.id_pergunta))
+    if alteracao_formulario is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Pergunta não encontrada"
+        )
+    
+    # A chave estrangeira continua sendo a garantia final da existência da pergunta
+    try:
+        db_opcao = db.execute(
+            insert(OpcoesRespostas).values(**opcao.model_dump()).returning(OpcoesRespostas)
+        ).scalar_one()
+    except IntegrityError as erro:
+        db.rollback()
+        if not eh_violacao_fk(erro):
+            raise
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Pergunta não encontrada"
         )
     
-    db_opcao = OpcoesRespostas(**opcao.model_dump())
-    db.add(db_opcao)
+    registrar_alteracoes(db, [
+        (
+            EntidadeAlteracaoEnum.OPCAO_RESPOSTA, OperacaoAlteracaoEnum.CRIAR, db_opcao.id,
+            OpcoesRespostasResponse.model_validate(db_opcao).model_dump(mode="json")
+        ),
+        alteracao_formulario
+    ])
     db.commit()
-    db.refresh(db_opcao)
+    response.headers["ETag"] = etag(db_opcao.versao)
     return db_opcao
 
 @router.get("/pergunta/{pergunta_id}", response_model=List[OpcoesRespostasResponse])
@@ -43,7 +78,7 @@ def listar_opcoes_pergunta(pergunta_id: int, db: Session = Depends(get_db)):
     return opcoes
 
 @router.get("/{opcao_id}", response_model=OpcoesRespostasResponse)
-def obter_opcao_resposta(opcao_id: int, db: Session = Depends(get_db)):
+def obter_opcao_resposta(opcao_id: int, response: Response, db: Session = Depends(get_db)):
     """Obter uma opção de resposta específica por ID"""
     opcao = db.query(OpcoesRespostas).filter(OpcoesRespostas.id == opcao_id).first()
     if not opcao:
@@ -51,41 +86,88 @@ def obter_opcao_resposta(opcao_id: int, db: Session = Depends(get_db)):
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Opção de resposta não encontrada"
         )
+    response.headers["ETag"] = etag(opcao.versao)
     return opcao
 
 @router.put("/{opcao_id}", response_model=OpcoesRespostasResponse)
 def atualizar_opcao_resposta(
     opcao_id: int, 
     opcao_update: OpcoesRespostasUpdate, 
+    response: Response,
+    if_match: Optional[str] = Header(None),
     db: Session = Depends(get_db)
 ):
     """Atualizar uma opção de resposta existente"""
-    opcao = db.query(OpcoesRespostas).filter(OpcoesRespostas.id == opcao_id).first()
-    if not opcao:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Opção de resposta não encontrada"
-        )
-    
+    versao = versao_if_match(if_match)
     update_data = opcao_update.model_dump(exclude_unset=True)
-    for field, value in update_data.items():
-        setattr(opcao, field, value)
     
-    db.commit()
-    db.refresh(opcao)
+    if not update_data:
+        # Nada a gravar: apenas confere existência e versão
+        opcao = db.get(OpcoesRespostas, opcao_id)
+        if not opcao:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Opção de resposta não encontrada"
+            )
+        if versao is not None and opcao.versao != versao:
+            raise erro_versao_desatualizada()
+    else:
+        # O formulário é travado antes da opção; sem linha, a opção não existe
+        alteracao_formulario = incrementar_versao_formulario(db, formulario_da_opcao(opcao_id))
+        if alteracao_formulario is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Opção de resposta não encontrada"
+            )
+        
+        query = update(OpcoesRespostas).where(OpcoesRespostas.id == opcao_id)
+        if versao is not None:
+            query = query.where(OpcoesRespostas.versao == versao)
+        opcao = db.execute(
+            query.values(**update_data, versao=OpcoesRespostas.versao + 1).returning(OpcoesRespostas)
+        ).scalar_one_or_none()
+        if opcao is None:
+            raise erro_sem_linha(db, OpcoesRespostas, opcao_id, versao, "Opção de resposta não encontrada")
+        
+        registrar_alteracoes(db, [
+            (
+                EntidadeAlteracaoEnum.OPCAO_RESPOSTA, OperacaoAlteracaoEnum.ATUALIZAR, opcao.id,
+                OpcoesRespostasResponse.model_validate(opcao).model_dump(mode="json")
+            ),
+            alteracao_formulario
+        ])
+        db.commit()
+    
+    response.headers["ETag"] = etag(opcao.versao)
     return opcao
 
 @router.delete("/{opcao_id}", status_code=status.HTTP_204_NO_CONTENT)
-def deletar_opcao_resposta(opcao_id: int, db: Session = Depends(get_db)):
+def deletar_opcao_resposta(
+    opcao_id: int,
+    if_match: Optional[str] = Header(None),
+    db: Session = Depends(get_db)
+):
     """Deletar uma opção de resposta"""
-    opcao = db.query(OpcoesRespostas).filter(OpcoesRespostas.id == opcao_id).first()
-    if not opcao:
+    versao = versao_if_match(if_match)
+    # O formulário é travado antes da opção; sem linha, a opção não existe
+    alteracao_formulario = incrementar_versao_formulario(db, formulario_da_opcao(opcao_id))
+    if alteracao_formulario is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Opção de resposta não encontrada"
         )
     
-    db.delete(opcao)
+    query = delete(OpcoesRespostas).where(OpcoesRespostas.id == opcao_id)
+    if versao is not None:
+        query = query.where(OpcoesRespostas.versao == versao)
+    
+    # Vínculos com perguntas condicionais são removidos pelo ON DELETE CASCADE do banco
+    if db.execute(query.returning(OpcoesRespostas.id)).scalar_one_or_none() is None:
+        raise erro_sem_linha(db, OpcoesRespostas, opcao_id, versao, "Opção de resposta não encontrada")
+    
+    registrar_alteracoes(db, [
+        (EntidadeAlteracaoEnum.OPCAO_RESPOSTA, OperacaoAlteracaoEnum.DELETAR, opcao_id, None),
+        alteracao_formulario
+    ])
     db.commit()
     return None
-
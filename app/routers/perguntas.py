@@ -1,6 +1,8 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
-from sqlalchemy import asc, desc, func
+from fastapi import APIRouter, Depends, Header, HTTPException, Response, status, Query
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy import asc, desc, func, delete, insert, update
 from typing import List, Optional
 from app.database.database import get_db
 from app.models.models import Pergunta, Formulario
@@ -9,7 +11,19 @@ from app.schemas.schemas import (
     PerguntaUpdate, 
     PerguntaResponse, 
     PerguntaSimpleResponse,
-    TipoPerguntaEnum
+    TipoPerguntaEnum,
+    EntidadeAlteracaoEnum,
+    OperacaoAlteracaoEnum
+)
+from app.services.alteracoes import registrar_alteracoes
+from app.services.escrita import (
+    eh_violacao_fk,
+    erro_sem_linha,
+    erro_versao_desatualizada,
+    etag,
+    formulario_da_pergunta,
+    incrementar_versao_formulario,
+    versao_if_match
 )
 
 router = APIRouter(prefix="/perguntas", tags=["perguntas"])
@@ -24,20 +38,42 @@ class PerguntasPaginatedResponse:
         self.pages = (total + size - 1) // size
 
 @router.post("/", response_model=PerguntaResponse, status_code=status.HTTP_201_CREATED)
-def criar_pergunta(pergunta: PerguntaCreate, db: Session = Depends(get_db)):
+def criar_pergunta(pergunta: PerguntaCreate, response: Response, db: Session = Depends(get_db)):
     """Criar uma nova pergunta"""
-    # Verificar se o formulário existe
-    formulario = db.query(Formulario).filter(Formulario.id == pergunta.id_formulario).first()
-    if not formulario:
+    # Trava o formulário antes da pergunta, a ordem de bloqueio de todas as
+    # escritas; sem linha atualizada, o formulário não existe
+    alteracao_formulario = incrementar_versao_formulario(db, pergunta.id_formulario)
+    if alteracao_formulario is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Formulário não encontrado"
         )
     
-    db_pergunta = Pergunta(**pergunta.model_dump())
-    db.add(db_pergunta)
+    # A chave estrangeira continua sendo a garantia final da existência do formulário
+    try:
+        db_pergunta = db.execute(
+            insert(Pergunta).values(**pergunta.model_dump()).returning(Pergunta)
+        ).scalar_one()
+    except IntegrityError as erro:
+        db.rollback()
+        if not eh_violacao_fk(erro):
+            raise
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Formulário não encontrado"
+        )
+    
+    # Uma pergunta recém-criada não tem opções: evita o SELECT do lazy load
+    set_committed_value(db_pergunta, "opcoes_respostas", [])
+    registrar_alteracoes(db, [
+        (
+            EntidadeAlteracaoEnum.PERGUNTA, OperacaoAlteracaoEnum.CRIAR, db_pergunta.id,
+            PerguntaSimpleResponse.model_validate(db_pergunta).model_dump(mode="json")
+        ),
+        alteracao_formulario
+    ])
     db.commit()
-    db.refresh(db_pergunta)
+    response.headers["ETag"] = etag(db_pergunta.versao)
     return db_pergunta
 
 @router.get("/", response_model=List[PerguntaSimpleResponse])
@@ -139,7 +175,7 @@ def listar_perguntas_paginado(
     }
 
 @router.get("/{pergunta_id}", response_model=PerguntaResponse)
-def obter_pergunta(pergunta_id: int, db: Session = Depends(get_db)):
+def obter_pergunta(pergunta_id: int, response: Response, db: Session = Depends(get_db)):
     """Obter uma pergunta específica por ID"""
     pergunta = db.query(Pergunta).filter(Pergunta.id == pergunta_id).first()
     if not pergunta:
@@ -147,41 +183,92 @@ def obter_pergunta(pergunta_id: int, db: Session = Depends(get_db)):
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Pergunta não encontrada"
         )
+    response.headers["ETag"] = etag(pergunta.versao)
     return pergunta
 
 @router.put("/{pergunta_id}", response_model=PerguntaResponse)
 def atualizar_pergunta(
     pergunta_id: int, 
     pergunta_update: PerguntaUpdate, 
+    response: Response,
+    if_match: Optional[str] = Header(None),
     db: Session = Depends(get_db)
 ):
     """Atualizar uma pergunta existente"""
-    pergunta = db.query(Pergunta).filter(Pergunta.id == pergunta_id).first()
-    if not pergunta:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Pergunta não encontrada"
-        )
-    
+    versao = versao_if_match(if_match)
     update_data = pergunta_update.model_dump(exclude_unset=True)
-    for field, value in update_data.items():
-        setattr(pergunta, field, value)
     
-    db.commit()
-    db.refresh(pergunta)
+    if not update_data:
+        # Nada a gravar: apenas confere existência e versão
+        pergunta = db.get(Pergunta, pergunta_id, options=[selectinload(Pergunta.opcoes_respostas)])
+        if not pergunta:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Pergunta não encontrada"
+            )
+        if versao is not None and pergunta.versao != versao:
+            raise erro_versao_desatualizada()
+    else:
+        # O formulário é travado antes da pergunta; sem linha, a pergunta não existe
+        alteracao_formulario = incrementar_versao_formulario(db, formulario_da_pergunta(pergunta_id))
+        if alteracao_formulario is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Pergunta não encontrada"
+            )
+        
+        query = update(Pergunta).where(Pergunta.id == pergunta_id)
+        if versao is not None:
+            query = query.where(Pergunta.versao == versao)
+        # As opções da resposta vêm em um único SELECT, sem lazy load
+        pergunta = db.execute(
+            query.values(**update_data, versao=Pergunta.versao + 1)
+            .returning(Pergunta)
+            .options(selectinload(Pergunta.opcoes_respostas))
+        ).scalar_one_or_none()
+        if pergunta is None:
+            raise erro_sem_linha(db, Pergunta, pergunta_id, versao, "Pergunta não encontrada")
+        
+        registrar_alteracoes(db, [
+            (
+                EntidadeAlteracaoEnum.PERGUNTA, OperacaoAlteracaoEnum.ATUALIZAR, pergunta.id,
+                PerguntaSimpleResponse.model_validate(pergunta).model_dump(mode="json")
+            ),
+            alteracao_formulario
+        ])
+        db.commit()
+    
+    response.headers["ETag"] = etag(pergunta.versao)
     return pergunta
 
 @router.delete("/{pergunta_id}", status_code=status.HTTP_204_NO_CONTENT)
-def deletar_pergunta(pergunta_id: int, db: Session = Depends(get_db)):
+def deletar_pergunta(
+    pergunta_id: int,
+    if_match: Optional[str] = Header(None),
+    db: Session = Depends(get_db)
+):
     """Deletar uma pergunta"""
-    pergunta = db.query(Pergunta).filter(Pergunta.id == pergunta_id).first()
-    if not pergunta:
+    versao = versao_if_match(if_match)
+    # O formulário é travado antes da pergunta; sem linha, a pergunta não existe
+    alteracao_formulario = incrementar_versao_formulario(db, formulario_da_pergunta(pergunta_id))
+    if alteracao_formulario is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Pergunta não encontrada"
         )
     
-    db.delete(pergunta)
+    query = delete(Pergunta).where(Pergunta.id == pergunta_id)
+    if versao is not None:
+        query = query.where(Pergunta.versao == versao)
+    
+    # Opções e vínculos são removidos pelo ON DELETE CASCADE do banco
+    if db.execute(query.returning(Pergunta.id)).scalar_one_or_none() is None:
+        raise erro_sem_linha(db, Pergunta, pergunta_id, versao, "Pergunta não encontrada")
+    
+    registrar_alteracoes(db, [
+        (EntidadeAlteracaoEnum.PERGUNTA, OperacaoAlteracaoEnum.DELETAR, pergunta_id, None),
+        alteracao_formulario
+    ])
     db.commit()
     return None
 
@@ -1,5 +1,6 @@
-from pydantic import BaseModel, ConfigDict
-from typing import List, Optional
+from pydantic import BaseModel, ConfigDict, model_validator
+from typing import Any, Dict, List, Optional
+from datetime import datetime
 from enum import Enum
 
 class TipoPerguntaEnum(str, Enum):
@@ -10,6 +11,17 @@ class TipoPerguntaEnum(str, Enum):
     INTEIRO = "Inteiro"
     NUMERO_DECIMAL = "Numero com duas casa decimais"
 
+class EntidadeAlteracaoEnum(str, Enum):
+    FORMULARIO = "formulario"
+    PERGUNTA = "pergunta"
+    OPCAO_RESPOSTA = "opcao_resposta"
+    VINCULO = "opcao_resposta_pergunta"
+
+class OperacaoAlteracaoEnum(str, Enum):
+    CRIAR = "criar"
+    ATUALIZAR = "atualizar"
+    DELETAR = "deletar"
+
 # Schemas para OpcoesRespostas
 class OpcoesRespostasBase(BaseModel):
     resposta: str
@@ -27,6 +39,7 @@ class OpcoesRespostasUpdate(BaseModel):
 class OpcoesRespostasResponse(OpcoesRespostasBase):
     id: int
     id_pergunta: int
+    versao: int
     
     model_config = ConfigDict(from_attributes=True)
 
@@ -68,6 +81,7 @@ class PerguntaUpdate(BaseModel):
 class PerguntaResponse(PerguntaBase):
     id: int
     id_formulario: int
+    versao: int
     opcoes_respostas: List[OpcoesRespostasResponse] = []
     
     model_config = ConfigDict(from_attributes=True)
@@ -88,6 +102,7 @@ class FormularioUpdate(BaseModel):
 
 class FormularioResponse(FormularioBase):
     id: int
+    versao: int
     perguntas: List[PerguntaResponse] = []
     
     model_config = ConfigDict(from_attributes=True)
@@ -95,6 +110,7 @@ class FormularioResponse(FormularioBase):
 # Schema para listagem simples de formulários (sem perguntas)
 class FormularioSimpleResponse(FormularioBase):
     id: int
+    versao: int
     
     model_config = ConfigDict(from_attributes=True)
 
@@ -102,6 +118,7 @@ class FormularioSimpleResponse(FormularioBase):
 class PerguntaSimpleResponse(PerguntaBase):
     id: int
     id_formulario: int
+    versao: int
     
     model_config = ConfigDict(from_attributes=True)
 
@@ -117,3 +134,59 @@ class PaginatedResponse(BaseModel):
     size: int
     pages: int
 
+
+# Schemas para o feed de alterações
+class AlteracaoResponse(BaseModel):
+    seq: int
+    entidade: EntidadeAlteracaoEnum
+    id_entidade: int
+    operacao: OperacaoAlteracaoEnum
+    dados: Optional[Dict[str, Any]] = None
+    criado_em: datetime
+    
+    model_config = ConfigDict(from_attributes=True)
+
+class AlteracoesResponse(BaseModel):
+    items: List[AlteracaoResponse]
+    ultimo_seq: int
+    has_more: bool
+
+# Schemas para edição da árvore completa de um formulário
+class ReferenciaPergunta(BaseModel):
+    """Pergunta existente (id) ou criada na mesma requisição (ref)"""
+    id: Optional[int] = None
+    ref: Optional[str] = None
+    
+    @model_validator(mode="after")
+    def validar_referencia(self):
+        if (self.id is None) == (self.ref is None):
+            raise ValueError("Informe exatamente um entre 'id' e 'ref'")
+        return self
+
+class OpcaoRespostaArvore(OpcoesRespostasBase):
+    id: Optional[int] = None
+    ref: Optional[str] = None
+    # Perguntas exibidas quando esta opção é escolhida
+    perguntas_condicionais: List[ReferenciaPergunta] = []
+
+class PerguntaArvore(PerguntaBase):
+    id: Optional[int] = None
+    ref: Optional[str] = None
+    opcoes_respostas: List[OpcaoRespostaArvore] = []
+
+class FormularioArvore(FormularioBase):
+    perguntas: List[PerguntaArvore] = []
+
+class ResumoAlteracoes(BaseModel):
+    criadas: List[int] = []
+    atualizadas: List[int] = []
+    removidas: List[int] = []
+
+class ArvoreAlteracoesResponse(BaseModel):
+    versao: int
+    campos_formulario: List[str] = []
+    perguntas: ResumoAlteracoes
+    opcoes_respostas: ResumoAlteracoes
+    vinculos: ResumoAlteracoes
+    # Ids gerados para os itens novos que informaram 'ref'
+    refs: Dict[str, int] = {}
@@ -0,0 +1 @@
+# Serviços da aplicação
@@ -0,0 +1,201 @@
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import func, insert, text
+from sqlalchemy.orm import Session
+from app.database.database import SessionLocal
+from app.models.models import Alteracao, CompactacaoAlteracoes
+from app.schemas.schemas import EntidadeAlteracaoEnum, OperacaoAlteracaoEnum
+
+logger = logging.getLogger(__name__)
+
+# Chave do advisory lock que serializa as escritas no feed. Sem ele, uma
+# transação que obteve um seq menor poderia fazer commit depois de outra com
+# seq maior, e um cliente que já leu o seq maior nunca veria a alteração.
+CHAVE_LOCK_ALTERACOES = 7_026_001
+# Evita que várias instâncias da API compactem o feed ao mesmo tempo
+CHAVE_LOCK_COMPACTACAO = 7_026_002
+
+# Exclusões mais antigas que isto são expurgadas; clientes que ficaram mais
+# tempo sem sincronizar recebem 410 e recomeçam do zero
+RETENCAO_ALTERACOES = timedelta(days=float(os.getenv("ALTERACOES_RETENCAO_DIAS", "30")))
+INTERVALO_COMPACTACAO_SEGUNDOS = float(os.getenv("ALTERACOES_COMPACTACAO_INTERVALO_SEGUNDOS", "3600"))
+TAMANHO_LOTE_COMPACTACAO = 500
+
+def registrar_alteracao(
+    db: Session,
+    entidade: EntidadeAlteracaoEnum,
+    operacao: OperacaoAlteracaoEnum,
+    id_entidade: int,
+    dados: Optional[Dict[str, Any]] = None
+) -> None:
+    """Adicionar uma entrada ao feed na mesma transação da escrita.
+
+    Deve ser chamada antes do ``db.commit()`` do router, para que a entidade
+    e a alteração sejam gravadas (ou descartadas) juntas.
+    """
+    registrar_alteracoes(db, [(entidade, operacao, id_entidade, dados)])
+
+def registrar_alteracoes(
+    db: Session,
+    alteracoes: List[Tuple[EntidadeAlteracaoEnum, OperacaoAlteracaoEnum, int, Optional[Dict[str, Any]]]]
+) -> None:
+    """Adicionar várias entradas ao feed, na ordem recebida, com um único lock"""
+    if not alteracoes:
+        return
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(text("SELECT pg_advisory_xact_lock(:chave)"), {"chave": CHAVE_LOCK_ALTERACOES})
+    # INSERT sem RETURNING: os seqs gerados não são usados, e as entradas
+    # seguem em um único comando (executemany) em vez de uma ida por linha
+    db.execute(insert(Alteracao), [
+        {
+            "entidade": entidade.value,
+            "id_entidade": id_entidade,
+            "operacao": operacao.value,
+            "dados": dados
+        }
+        for entidade, operacao, id_entidade, dados in alteracoes
+    ])
+
+def listar_alteracoes(db: Session, desde: int, limite: int) -> List[Alteracao]:
+    """Listar as alterações com seq maior que ``desde``, em ordem crescente"""
+    return (
+        db.query(Alteracao)
+        .filter(Alteracao.seq > desde)
+        .order_by(Alteracao.seq)
+        .limit(limite)
+        .all()
+    )
+
+def ultimo_seq(db: Session) -> int:
+    """Obter o maior seq gravado (0 se o feed estiver vazio)"""
+    return db.query(func.coalesce(func.max(Alteracao.seq), 0)).scalar()
+
+def horizonte_seq(db: Session) -> int:
+    """Obter o seq até o qual exclusões já foram expurgadas (0 se nunca houve)"""
+    return db.query(func.coalesce(func.max(CompactacaoAlteracoes.horizonte_seq), 0)).scalar()
+
+def seq_anterior_a(db: Session, limite: datetime) -> int:
+    """Obter o maior seq gravado antes de ``limite`` (0 se não houver)"""
+    if db.get_bind().dialect.name == "sqlite":
+        # O SQLite grava CURRENT_TIMESTAMP em UTC, sem fuso
+        limite = limite.astimezone(timezone.utc).replace(tzinfo=None)
+    return (
+        db.query(func.coalesce(func.max(Alteracao.seq), 0))
+        .filter(Alteracao.criado_em < limite)
+        .scalar()
+    )
+
+def _pais(entidade: str, dados: Optional[Dict[str, Any]]) -> List[Tuple[str, int]]:
+    if not dados:
+        return []
+    if entidade == EntidadeAlteracaoEnum.PERGUNTA.value:
+        return [(EntidadeAlteracaoEnum.FORMULARIO.value, dados["id_formulario"])]
+    if entidade == EntidadeAlteracaoEnum.OPCAO_RESPOSTA.value:
+        return [(EntidadeAlteracaoEnum.PERGUNTA.value, dados["id_pergunta"])]
+    if entidade == EntidadeAlteracaoEnum.VINCULO.value:
+        return [
+            (EntidadeAlteracaoEnum.OPCAO_RESPOSTA.value, dados["id_opcao_resposta"]),
+            (EntidadeAlteracaoEnum.PERGUNTA.value, dados["id_pergunta"])
+        ]
+    return []
+
+def compactar_alteracoes(db: Session, horizonte: int) -> int:
+    """Compactar o feed e expurgar entidades excluídas até o seq ``horizonte``.
+
+    Para cada entidade ficam só a primeira entrada (o ``criar``) e a mais
+    recente; as atualizações intermediárias saem. Manter o ``criar`` garante
+    que, numa leitura a partir do zero, um pai sempre aparece antes dos filhos.
+
+    Uma entidade excluída (pela própria exclusão ou pela de um formulário,
+    pergunta ou opção acima dela, propagada em cascata) perde todas
+    as entradas quando a exclusão tem seq até ``horizonte``. Os filhos morrem
+    junto ou antes dos pais, então nenhuma entrada mantida depende de uma
+    entidade expurgada. Clientes com cursor anterior ao horizonte passam a
+    receber 410 e precisam sincronizar de novo a partir do zero.
+    """
+    entradas = {}
+    primeiras = {}
+    exclusoes = {}
+    # Varredura só das colunas de controle, em lotes; os blobs de ``dados``
+    # não são carregados aqui
+    for seq, entidade, id_entidade, operacao in (
+        db.query(Alteracao.seq, Alteracao.entidade, Alteracao.id_entidade, Alteracao.operacao)
+        .order_by(Alteracao.seq)
+        .yield_per(TAMANHO_LOTE_COMPACTACAO)
+    ):
+        chave = (entidade, id_entidade)
+        entradas.setdefault(chave, []).append(seq)
+        if operacao == OperacaoAlteracaoEnum.DELETAR.value:
+            exclusoes[chave] = seq
+        elif chave not in primeiras and entidade != EntidadeAlteracaoEnum.FORMULARIO.value:
+            primeiras[chave] = seq
+
+    # Os pais de cada entidade vêm dos ``dados`` da sua primeira entrada, e só
+    # interessam se alguma exclusão pode ser expurgada
+    pais = {}
+    if not any(seq <= horizonte for seq in exclusoes.values()):
+        primeiras = {}
+    chaves_por_seq = {seq: chave for chave, seq in primeiras.items()}
+    seqs_primeiras = list(chaves_por_seq)
+    for inicio in range(0, len(seqs_primeiras), TAMANHO_LOTE_COMPACTACAO):
+        lote = seqs_primeiras[inicio:inicio + TAMANHO_LOTE_COMPACTACAO]
+        for seq, dados in db.query(Alteracao.seq, Alteracao.dados).filter(Alteracao.seq.in_(lote)):
+            chave = chaves_por_seq[seq]
+            pais[chave] = _pais(chave[0], dados)
+
+    mortes = {}
+
+    def morte(chave) -> Optional[int]:
+        if chave not in mortes:
+            candidatas = [morte(pai) for pai in pais.get(chave, [])] + [exclusoes.get(chave)]
+            candidatas = [seq for seq in candidatas if seq is not None]
+            mortes[chave] = min(candidatas) if candidatas else None
+        return mortes[chave]
+
+    removidas = []
+    for chave, seqs in entradas.items():
+        seq_morte = morte(chave)
+        if seq_morte is not None and seq_morte <= horizonte:
+            removidas.extend(seqs)
+        else:
+            removidas.extend(seqs[1:-1])
+
+    for inicio in range(0, len(removidas), TAMANHO_LOTE_COMPACTACAO):
+        lote = removidas[inicio:inicio + TAMANHO_LOTE_COMPACTACAO]
+        db.query(Alteracao).filter(Alteracao.seq.in_(lote)).delete(synchronize_session=False)
+    db.add(CompactacaoAlteracoes(horizonte_seq=horizonte, removidas=len(removidas)))
+    db.commit()
+    return len(removidas)
+
+def executar_compactacao(retencao: timedelta = RETENCAO_ALTERACOES) -> Optional[int]:
+    """Compactar o feed expurgando exclusões mais antigas que ``retencao``.
+
+    Retorna None quando outra instância já está compactando.
+    """
+    db = SessionLocal()
+    try:
+        if db.get_bind().dialect.name == "postgresql":
+            livre = db.execute(
+                text("SELECT pg_try_advisory_xact_lock(:chave)"), {"chave": CHAVE_LOCK_COMPACTACAO}
+            ).scalar()
+            if not livre:
+                return None
+        horizonte = max(horizonte_seq(db), seq_anterior_a(db, datetime.now(timezone.utc) - retencao))
+        return compactar_alteracoes(db, horizonte)
+    finally:
+        db.close()
+
+async def compactar_periodicamente(intervalo: float = INTERVALO_COMPACTACAO_SEGUNDOS) -> None:
+    """Executar a compactação em segundo plano a cada ``intervalo`` segundos"""
+    while True:
+        await asyncio.sleep(intervalo)
+        try:
+            removidas = await run_in_threadpool(executar_compactacao)
+            if removidas is not None:
+                logger.info("Feed de alterações compactado: %s entradas removidas", removidas)
+        except Exception:
+            logger.exception("Falha ao compactar o feed de alterações")
@@ -0,0 +1,302 @@
+from typing import Any, Dict, List, NamedTuple, Optional
+from fastapi import HTTPException, status
+from sqlalchemy import delete, insert, update
+from sqlalchemy.orm import Session
+from app.models.models import Formulario, Pergunta, OpcoesRespostas, OpcoesRespostaPergunta
+from app.schemas.schemas import (
+    FormularioArvore,
+    FormularioBase,
+    PerguntaBase,
+    OpcoesRespostasBase,
+    FormularioSimpleResponse,
+    PerguntaSimpleResponse,
+    OpcoesRespostasResponse,
+    OpcoesRespostaPerguntaResponse,
+    EntidadeAlteracaoEnum,
+    OperacaoAlteracaoEnum
+)
+from app.services.alteracoes import registrar_alteracoes
+
+CAMPOS_FORMULARIO = list(FormularioBase.model_fields)
+CAMPOS_PERGUNTA = list(PerguntaBase.model_fields)
+CAMPOS_OPCAO = list(OpcoesRespostasBase.model_fields)
+
+class ArvoreArmazenada(NamedTuple):
+    formulario: Formulario
+    perguntas: Dict[int, Pergunta]
+    opcoes: Dict[int, OpcoesRespostas]
+    vinculos: List[OpcoesRespostaPergunta]
+
+def carregar_arvore(db: Session, formulario_id: int) -> Optional[ArvoreArmazenada]:
+    """Carregar a árvore gravada de um formulário com uma consulta por nível.
+
+    Formulário, perguntas e opções ficam bloqueados (FOR UPDATE) até o fim da
+    transação, para que o diff não seja aplicado sobre um estado já alterado.
+    O formulário é bloqueado primeiro, na mesma ordem das escritas avulsas de
+    perguntas e opções (ver ``incrementar_versao_formulario``), o que evita
+    deadlock entre elas.
+    """
+    formulario = db.query(Formulario).filter(Formulario.id == formulario_id).with_for_update().first()
+    if not formulario:
+        return None
+
+    perguntas = {
+        pergunta.id: pergunta
+        for pergunta in db.query(Pergunta).filter(Pergunta.id_formulario == formulario_id).with_for_update()
+    }
+    opcoes = {
+        opcao.id: opcao
+        for opcao in db.query(OpcoesRespostas)
+        .join(Pergunta, OpcoesRespostas.id_pergunta == Pergunta.id)
+        .filter(Pergunta.id_formulario == formulario_id)
+        .with_for_update(of=OpcoesRespostas)
+    }
+    vinculos = (
+        db.query(OpcoesRespostaPergunta)
+        .join(OpcoesRespostas, OpcoesRespostaPergunta.id_opcao_resposta == OpcoesRespostas.id)
+        .join(Pergunta, OpcoesRespostas.id_pergunta == Pergunta.id)
+        .filter(Pergunta.id_formulario == formulario_id)
+        .all()
+    )
+    return ArvoreArmazenada(formulario, perguntas, opcoes, vinculos)
+
+def _erro_arvore(detalhe: str) -> HTTPException:
+    return HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=detalhe)
+
+def _valores(item, campos: List[str]) -> Dict[str, Any]:
+    return {campo: getattr(item, campo) for campo in campos}
+
+def _campos_alterados(atual, desejado: Dict[str, Any]) -> Dict[str, Any]:
+    return {campo: valor for campo, valor in desejado.items() if getattr(atual, campo) != valor}
+
+def _validar_arvore(armazenada: ArvoreArmazenada, arvore: FormularioArvore) -> Dict[str, int]:
+    """Conferir ids, refs e vínculos da árvore desejada.
+
+    Retorna o índice de cada ref de pergunta na lista ``arvore.perguntas``.
+    """
+    perguntas_vistas = set()
+    opcoes_vistas = set()
+    refs = set()
+    refs_perguntas = {}
+
+    def registrar_ref(ref: Optional[str]):
+        if ref is None:
+            return
+        if ref in refs:
+            raise _erro_arvore(f"Ref '{ref}' repetida")
+        refs.add(ref)
+
+    for indice, pergunta in enumerate(arvore.perguntas):
+        if pergunta.id is not None:
+            if pergunta.id not in armazenada.perguntas:
+                raise _erro_arvore(f"Pergunta {pergunta.id} não pertence ao formulário")
+            if pergunta.id in perguntas_vistas:
+                raise _erro_arvore(f"Pergunta {pergunta.id} repetida")
+            perguntas_vistas.add(pergunta.id)
+        registrar_ref(pergunta.ref)
+        if pergunta.ref is not None:
+            refs_perguntas[pergunta.ref] = indice
+
+        for opcao in pergunta.opcoes_respostas:
+            if opcao.id is not None:
+                if opcao.id not in armazenada.opcoes or armazenada.opcoes[opcao.id].id_pergunta != pergunta.id:
+                    raise _erro_arvore(f"Opção de resposta {opcao.id} não pertence à pergunta")
+                if opcao.id in opcoes_vistas:
+                    raise _erro_arvore(f"Opção de resposta {opcao.id} repetida")
+                opcoes_vistas.add(opcao.id)
+            registrar_ref(opcao.ref)
+
+    for pergunta in arvore.perguntas:
+        for opcao in pergunta.opcoes_respostas:
+            for alvo in opcao.perguntas_condicionais:
+                if alvo.id is not None and alvo.id not in perguntas_vistas:
+                    raise _erro_arvore(f"Pergunta condicional {alvo.id} não está na árvore")
+                if alvo.ref is not None and alvo.ref not in refs_perguntas:
+                    raise _erro_arvore(f"Pergunta condicional '{alvo.ref}' não está na árvore")
+
+    return refs_perguntas
+
+def aplicar_arvore(db: Session, armazenada: ArvoreArmazenada, arvore: FormularioArvore) -> Dict[str, Any]:
+    """Gravar apenas as diferenças entre a árvore armazenada e a desejada.
+
+    Cada tipo de operação vira um único comando em lote (DELETE ... IN,
+    INSERT ... RETURNING com vários valores, UPDATE por chave primária). A
+    versão do formulário é incrementada sempre que algo na árvore muda.
+    Opções e vínculos de perguntas removidas saem pelo ON DELETE CASCADE e
+    não aparecem no resumo nem no feed de alterações.
+    """
+    refs_perguntas = _validar_arvore(armazenada, arvore)
+    formulario = armazenada.formulario
+    alteracoes = []
+
+    # Perguntas
+    ids_mantidos = {pergunta.id for pergunta in arvore.perguntas if pergunta.id is not None}
+    perguntas_removidas = [id_pergunta for id_pergunta in armazenada.perguntas if id_pergunta not in ids_mantidos]
+    perguntas_novas = [pergunta for pergunta in arvore.perguntas if pergunta.id is None]
+    perguntas_atualizadas = []
+    for pergunta in arvore.perguntas:
+        if pergunta.id is None:
+            continue
+        atual = armazenada.perguntas[pergunta.id]
+        alterados = _campos_alterados(atual, _valores(pergunta, CAMPOS_PERGUNTA))
+        if alterados:
+            perguntas_atualizadas.append({"id": pergunta.id, **alterados, "versao": atual.versao + 1})
+
+    if perguntas_removidas:
+        db.execute(delete(Pergunta).where(Pergunta.id.in_(perguntas_removidas)))
+
+    ids_perguntas_novas = []
+    if perguntas_novas:
+        ids_perguntas_novas = db.scalars(
+            insert(Pergunta).returning(Pergunta.id, sort_by_parameter_order=True),
+            [{"id_formulario": formulario.id, **_valores(pergunta, CAMPOS_PERGUNTA)} for pergunta in perguntas_novas]
+        ).all()
+
+    # Id final de cada pergunta, na ordem de arvore.perguntas
+    novos = iter(ids_perguntas_novas)
+    ids_perguntas = [pergunta.id if pergunta.id is not None else next(novos) for pergunta in arvore.perguntas]
+    refs = {ref: ids_perguntas[indice] for ref, indice in refs_perguntas.items()}
+
+    # Opções de resposta
+    opcoes_desejadas = [
+        (id_pergunta, opcao)
+        for id_pergunta, pergunta in zip(ids_perguntas, arvore.perguntas)
+        for opcao in pergunta.opcoes_respostas
+    ]
+    ids_opcoes_mantidas = {opcao.id for _, opcao in opcoes_desejadas if opcao.id is not None}
+    opcoes_removidas = [
+        id_opcao for id_opcao, opcao in armazenada.opcoes.items()
+        if id_opcao not in ids_opcoes_mantidas and opcao.id_pergunta in ids_mantidos
+    ]
+    opcoes_novas = [(id_pergunta, opcao) for id_pergunta, opcao in opcoes_desejadas if opcao.id is None]
+    opcoes_atualizadas = []
+    for _, opcao in opcoes_desejadas:
+        if opcao.id is None:
+            continue
+        atual = armazenada.opcoes[opcao.id]
+        alterados = _campos_alterados(atual, _valores(opcao, CAMPOS_OPCAO))
+        if alterados:
+            opcoes_atualizadas.append({"id": opcao.id, **alterados, "versao": atual.versao + 1})
+
+    if opcoes_removidas:
+        db.execute(delete(OpcoesRespostas).where(OpcoesRespostas.id.in_(opcoes_removidas)))
+
+    ids_opcoes_novas = []
+    if opcoes_novas:
+        ids_opcoes_novas = db.scalars(
+            insert(OpcoesRespostas).returning(OpcoesRespostas.id, sort_by_parameter_order=True),
+            [{"id_pergunta": id_pergunta, **_valores(opcao, CAMPOS_OPCAO)} for id_pergunta, opcao in opcoes_novas]
+        ).all()
+
+    novos = iter(ids_opcoes_novas)
+    ids_opcoes = [opcao.id if opcao.id is not None else next(novos) for _, opcao in opcoes_desejadas]
+    for id_opcao, (_, opcao) in zip(ids_opcoes, opcoes_desejadas):
+        if opcao.ref is not None:
+            refs[opcao.ref] = id_opcao
+
+    if perguntas_atualizadas:
+        db.execute(update(Pergunta), perguntas_atualizadas)
+    if opcoes_atualizadas:
+        db.execute(update(OpcoesRespostas), opcoes_atualizadas)
+
+    # Vínculos condicionais (opção -> pergunta)
+    vinculos_desejados = {
+        (id_opcao, alvo.id if alvo.id is not None else refs[alvo.ref])
+        for id_opcao, (_, opcao) in zip(ids_opcoes, opcoes_desejadas)
+        for alvo in opcao.perguntas_condicionais
+    }
+    vinculos_atuais = {(vinculo.id_opcao_resposta, vinculo.id_pergunta): vinculo.id for vinculo in armazenada.vinculos}
+    # Vínculos com opção ou pergunta removida já saem pela cascata, e vínculos
+    # para perguntas de outros formulários não são representáveis na árvore
+    vinculos_removidos = [
+        id_vinculo for (id_opcao, id_pergunta), id_vinculo in vinculos_atuais.items()
+        if (id_opcao, id_pergunta) not in vinculos_desejados
+        and id_opcao in ids_opcoes_mantidas
+        and id_pergunta in ids_mantidos
+    ]
+    vinculos_novos = sorted(par for par in vinculos_desejados if par not in vinculos_atuais)
+
+    if vinculos_removidos:
+        db.execute(delete(OpcoesRespostaPergunta).where(OpcoesRespostaPergunta.id.in_(vinculos_removidos)))
+
+    ids_vinculos_novos = []
+    if vinculos_novos:
+        ids_vinculos_novos = db.scalars(
+            insert(OpcoesRespostaPergunta).returning(OpcoesRespostaPergunta.id, sort_by_parameter_order=True),
+            [{"id_opcao_resposta": id_opcao, "id_pergunta": id_pergunta} for id_opcao, id_pergunta in vinculos_novos]
+        ).all()
+
+    # Formulário: a versão muda sempre que qualquer parte da árvore mudou
+    campos_formulario = _campos_alterados(formulario, _valores(arvore, CAMPOS_FORMULARIO))
+    houve_alteracao = any([
+        campos_formulario, perguntas_removidas, perguntas_novas, perguntas_atualizadas,
+        opcoes_removidas, opcoes_novas, opcoes_atualizadas, vinculos_removidos, vinculos_novos
+    ])
+    versao = formulario.versao
+    if houve_alteracao:
+        versao = db.execute(
+            update(Formulario)
+            .where(Formulario.id == formulario.id)
+            .values(**campos_formulario, versao=Formulario.versao + 1)
+            .returning(Formulario.versao)
+        ).scalar_one()
+
+    # Feed de alterações, na ordem em que as escritas foram feitas
+    for id_pergunta in perguntas_removidas:
+        alteracoes.append((EntidadeAlteracaoEnum.PERGUNTA, OperacaoAlteracaoEnum.DELETAR, id_pergunta, None))
+    for id_opcao in opcoes_removidas:
+        alteracoes.append((EntidadeAlteracaoEnum.OPCAO_RESPOSTA, OperacaoAlteracaoEnum.DELETAR, id_opcao, None))
+    for id_vinculo in vinculos_removidos:
+        alteracoes.append((EntidadeAlteracaoEnum.VINCULO, OperacaoAlteracaoEnum.DELETAR, id_vinculo, None))
+    for id_pergunta, pergunta in zip(ids_perguntas_novas, perguntas_novas):
+        dados = PerguntaSimpleResponse(
+            id=id_pergunta, id_formulario=formulario.id, versao=1, **_valores(pergunta, CAMPOS_PERGUNTA)
+        )
+        alteracoes.append((EntidadeAlteracaoEnum.PERGUNTA, OperacaoAlteracaoEnum.CRIAR, id_pergunta, dados.model_dump(mode="json")))
+    for id_opcao, (id_pergunta, opcao) in zip(ids_opcoes_novas, opcoes_novas):
+        dados = OpcoesRespostasResponse(
+            id=id_opcao, id_pergunta=id_pergunta, versao=1, **_valores(opcao, CAMPOS_OPCAO)
+        )
+        alteracoes.append((EntidadeAlteracaoEnum.OPCAO_RESPOSTA, OperacaoAlteracaoEnum.CRIAR, id_opcao, dados.model_dump(mode="json")))
+    for linha in perguntas_atualizadas:
+        atual = armazenada.perguntas[linha["id"]]
+        dados = PerguntaSimpleResponse(
+            id_formulario=atual.id_formulario, **{**_valores(atual, CAMPOS_PERGUNTA), **linha}
+        )
+        alteracoes.append((EntidadeAlteracaoEnum.PERGUNTA, OperacaoAlteracaoEnum.ATUALIZAR, atual.id, dados.model_dump(mode="json")))
+    for linha in opcoes_atualizadas:
+        atual = armazenada.opcoes[linha["id"]]
+        dados = OpcoesRespostasResponse(
+            id_pergunta=atual.id_pergunta, **{**_valores(atual, CAMPOS_OPCAO), **linha}
+        )
+        alteracoes.append((EntidadeAlteracaoEnum.OPCAO_RESPOSTA, OperacaoAlteracaoEnum.ATUALIZAR, atual.id, dados.model_dump(mode="json")))
+    for id_vinculo, (id_opcao, id_pergunta) in zip(ids_vinculos_novos, vinculos_novos):
+        dados = OpcoesRespostaPerguntaResponse(id=id_vinculo, id_opcao_resposta=id_opcao, id_pergunta=id_pergunta)
+        alteracoes.append((EntidadeAlteracaoEnum.VINCULO, OperacaoAlteracaoEnum.CRIAR, id_vinculo, dados.model_dump(mode="json")))
+    if houve_alteracao:
+        dados = FormularioSimpleResponse(
+            id=formulario.id, versao=versao, **{**_valores(formulario, CAMPOS_FORMULARIO), **campos_formulario}
+        )
+        alteracoes.append((EntidadeAlteracaoEnum.FORMULARIO, OperacaoAlteracaoEnum.ATUALIZAR, formulario.id, dados.model_dump(mode="json")))
+    registrar_alteracoes(db, alteracoes)
+
+    return {
+        "versao": versao,
+        "campos_formulario": list(campos_formulario),
+        "perguntas": {
+            "criadas": ids_perguntas_novas,
+            "atualizadas": [linha["id"] for linha in perguntas_atualizadas],
+            "removidas": perguntas_removidas
+        },
+        "opcoes_respostas": {
+            "criadas": ids_opcoes_novas,
+            "atualizadas": [linha["id"] for linha in opcoes_atualizadas],
+            "removidas": opcoes_removidas
+        },
+        "vinculos": {
+            "criadas": ids_vinculos_novos,
+            "atualizadas": [],
+            "removidas": vinculos_removidos
+        },
+        "refs": refs
+    }
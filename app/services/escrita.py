@@ -0,0 +1,94 @@
+from typing import Any, Dict, Optional, Tuple
+from fastapi import HTTPException, status
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app.models.models import Formulario, OpcoesRespostas, Pergunta
+from app.schemas.schemas import FormularioSimpleResponse, EntidadeAlteracaoEnum, OperacaoAlteracaoEnum
+
+# SQLSTATE do PostgreSQL para violação de chave estrangeira
+FOREIGN_KEY_VIOLATION = "23503"
+
+def eh_violacao_fk(erro: IntegrityError) -> bool:
+    """Verificar se o erro de integridade veio de uma chave estrangeira inexistente"""
+    codigo = getattr(erro.orig, "pgcode", None)
+    if codigo is not None:
+        return codigo == FOREIGN_KEY_VIOLATION
+    # Outros bancos (ex.: SQLite com foreign_keys=ON) não expõem SQLSTATE
+    return "foreign key" in str(erro.orig).lower()
+
+def versao_if_match(if_match: Optional[str]) -> Optional[int]:
+    """Extrair a versão esperada do cabeçalho If-Match (None se ausente ou "*")"""
+    if if_match is None or if_match.strip() == "*":
+        return None
+    valor = if_match.strip()
+    if valor.startswith("W/"):
+        valor = valor[2:]
+    valor = valor.strip('"')
+    if not valor.isdigit():
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Cabeçalho If-Match inválido"
+        )
+    return int(valor)
+
+def etag(versao: int) -> str:
+    """Montar o ETag correspondente a uma versão"""
+    return f'"{versao}"'
+
+def erro_versao_desatualizada() -> HTTPException:
+    """Montar o erro de If-Match que não corresponde à versão atual"""
+    return HTTPException(
+        status_code=status.HTTP_412_PRECONDITION_FAILED,
+        detail="Versão desatualizada: o registro foi alterado por outra requisição"
+    )
+
+def erro_sem_linha(db: Session, modelo, entidade_id: int, versao: Optional[int], detalhe: str) -> HTTPException:
+    """Montar o erro de um UPDATE/DELETE condicional que não afetou nenhuma linha.
+
+    Sem If-Match a única causa é a entidade não existir (404). Com If-Match
+    é preciso uma consulta extra, só neste caminho de erro, para diferenciar
+    entidade inexistente de versão desatualizada (412).
+    """
+    if versao is not None and db.query(modelo.id).filter(modelo.id == entidade_id).first():
+        return erro_versao_desatualizada()
+    return HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=detalhe)
+
+def incrementar_versao_formulario(
+    db: Session, id_formulario
+) -> Optional[Tuple[EntidadeAlteracaoEnum, OperacaoAlteracaoEnum, int, Dict[str, Any]]]:
+    """Incrementar a versão do formulário quando uma pergunta ou opção dele muda.
+
+    A versão do formulário representa a árvore inteira: é o ETag do GET do
+    formulário. Aceita o id ou uma subconsulta escalar que o resolva.
+
+    Deve ser o primeiro comando da escrita do filho: o UPDATE trava a linha do
+    formulário antes da do filho. Todas as escritas seguem essa ordem (a
+    exclusão do formulário também trava o formulário antes de apagar os filhos
+    em cascata), o que evita deadlock entre escritas concorrentes no mesmo
+    formulário. Retorna None se o formulário (ou a pergunta da subconsulta)
+    não existe; caso contrário, a entrada do feed com o formulário atualizado.
+    """
+    formulario = db.execute(
+        update(Formulario)
+        .where(Formulario.id == id_formulario)
+        .values(versao=Formulario.versao + 1)
+        .returning(Formulario)
+    ).scalar_one_or_none()
+    if formulario is None:
+        return None
+    dados = FormularioSimpleResponse.model_validate(formulario).model_dump(mode="json")
+    return (EntidadeAlteracaoEnum.FORMULARIO, OperacaoAlteracaoEnum.ATUALIZAR, formulario.id, dados)
+
+def formulario_da_pergunta(id_pergunta: int):
+    """Subconsulta com o id do formulário de uma pergunta"""
+    return select(Pergunta.id_formulario).where(Pergunta.id == id_pergunta).scalar_subquery()
+
+def formulario_da_opcao(id_opcao: int):
+    """Subconsulta com o id do formulário de uma opção de resposta"""
+    return (
+        select(Pergunta.id_formulario)
+        .join(OpcoesRespostas, OpcoesRespostas.id_pergunta == Pergunta.id)
+        .where(OpcoesRespostas.id == id_opcao)
+        .scalar_subquery()
+    )
@@ -0,0 +1 @@
+# Testes da aplicação
@@ -0,0 +1,69 @@
+import os
+import tempfile
+
+# O banco precisa ser definido antes de importar a aplicação, que cria o engine.
+# Por padrão um SQLite temporário; TEST_DATABASE_URL permite usar um PostgreSQL.
+_banco = os.path.join(tempfile.mkdtemp(), "testes.db")
+os.environ["DATABASE_URL"] = os.getenv("TEST_DATABASE_URL", f"sqlite:///{_banco}")
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from app.database.database import Base, engine
+from app.main import app
+
+def pytest_addoption(parser):
+    parser.addoption("--benchmark", action="store_true", help="Executar também os testes marcados com benchmark")
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption("--benchmark"):
+        return
+    pular = pytest.mark.skip(reason="benchmark: rode com --benchmark")
+    for item in items:
+        if "benchmark" in item.keywords:
+            item.add_marker(pular)
+
+def pytest_terminal_summary(terminalreporter):
+    """Listar as durações registradas pelos benchmarks (``record_property``)"""
+    duracoes = [
+        (relatorio.nodeid, valor)
+        for relatorio in terminalreporter.stats.get("passed", [])
+        if relatorio.when == "call"
+        for nome, valor in relatorio.user_properties
+        if nome == "duracao_ms"
+    ]
+    if duracoes:
+        terminalreporter.write_sep("-", "benchmarks")
+        for nodeid, valor in duracoes:
+            terminalreporter.write_line(f"{nodeid}: {valor} ms")
+
+@pytest.fixture
+def client():
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    with TestClient(app) as cliente:
+        yield cliente
+
+def _resumir(sql: str):
+    """Reduzir um comando SQL a (verbo, tabela), ex.: ("UPDATE", "formulario")"""
+    palavras = sql.split()
+    verbo = palavras[0].upper()
+    if "pg_advisory_xact_lock" in sql:
+        return "LOCK", None
+    if verbo in ("INSERT", "DELETE"):
+        return verbo, palavras[2]
+    if verbo == "UPDATE":
+        return verbo, palavras[1]
+    return verbo, None
+
+@pytest.fixture
+def comandos():
+    """Lista dos comandos SQL executados enquanto o teste roda, resumidos"""
+    executados = []
+
+    def registrar(conexao, cursor, sql, parametros, contexto, executemany):
+        executados.append(_resumir(sql))
+
+    event.listen(engine, "before_cursor_execute", registrar)
+    yield executados
+    event.remove(engine, "before_cursor_execute", registrar)
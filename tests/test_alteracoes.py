@@ -0,0 +1,240 @@
+import asyncio
+import json
+from datetime import timedelta
+from app.database.database import SessionLocal
+from app.routers import alteracoes as rotas_alteracoes
+from app.models.models import Alteracao, Formulario, OpcoesRespostaPergunta, OpcoesRespostas, Pergunta
+from app.schemas.schemas import (
+    FormularioSimpleResponse, OpcoesRespostaPerguntaResponse, OpcoesRespostasResponse, PerguntaSimpleResponse
+)
+from app.services.alteracoes import compactar_alteracoes, executar_compactacao, ultimo_seq
+
+# Pais de cada entidade no payload do feed, como as chaves estrangeiras do banco
+PAIS = {
+    "pergunta": [("formulario", "id_formulario")],
+    "opcao_resposta": [("pergunta", "id_pergunta")],
+    "opcao_resposta_pergunta": [("opcao_resposta", "id_opcao_resposta"), ("pergunta", "id_pergunta")],
+}
+
+class Replica:
+    """Cópia local alimentada só pelo feed, com chaves estrangeiras e cascata"""
+
+    def __init__(self):
+        self.entidades = {}
+        self.cursor = 0
+
+    def aplicar(self, alteracao):
+        chave = (alteracao["entidade"], alteracao["id_entidade"])
+        if alteracao["operacao"] == "deletar":
+            self._remover(chave)
+            return
+        for entidade_pai, campo in PAIS.get(alteracao["entidade"], []):
+            pai = (entidade_pai, alteracao["dados"][campo])
+            assert pai in self.entidades, f"{chave} recebido antes do pai {pai}"
+        self.entidades[chave] = alteracao["dados"]
+
+    def _remover(self, chave):
+        self.entidades.pop(chave, None)
+        filhos = [
+            (entidade, dados["id"])
+            for (entidade, _), dados in list(self.entidades.items())
+            for entidade_pai, campo in PAIS.get(entidade, [])
+            if (entidade_pai, dados[campo]) == chave
+        ]
+        for filho in filhos:
+            self._remover(filho)
+
+    def sincronizar(self, client, limite=7):
+        while True:
+            resposta = client.get("/alteracoes/", params={"desde": self.cursor, "limite": limite})
+            assert resposta.status_code == 200
+            pagina = resposta.json()
+            for alteracao in pagina["items"]:
+                self.aplicar(alteracao)
+            self.cursor = pagina["ultimo_seq"]
+            if not pagina["has_more"]:
+                return
+
+def _estado_servidor():
+    db = SessionLocal()
+    try:
+        estado = {}
+        for modelo, schema, entidade in [
+            (Formulario, FormularioSimpleResponse, "formulario"),
+            (Pergunta, PerguntaSimpleResponse, "pergunta"),
+            (OpcoesRespostas, OpcoesRespostasResponse, "opcao_resposta"),
+            (OpcoesRespostaPergunta, OpcoesRespostaPerguntaResponse, "opcao_resposta_pergunta"),
+        ]:
+            for registro in db.query(modelo):
+                estado[(entidade, registro.id)] = schema.model_validate(registro).model_dump(mode="json")
+        return estado
+    finally:
+        db.close()
+
+def _compactar(horizonte):
+    db = SessionLocal()
+    try:
+        return compactar_alteracoes(db, horizonte)
+    finally:
+        db.close()
+
+def _ultimo_seq():
+    db = SessionLocal()
+    try:
+        return ultimo_seq(db)
+    finally:
+        db.close()
+
+def _feed():
+    db = SessionLocal()
+    try:
+        return [(a.entidade, a.id_entidade, a.operacao) for a in db.query(Alteracao).order_by(Alteracao.seq)]
+    finally:
+        db.close()
+
+def _primeira_carga(client):
+    formulario = client.post("/formularios/", json={"titulo": "Pesquisa"}).json()
+    pergunta = client.post("/perguntas/", json={
+        "titulo": "Recomendaria?", "tipo_pergunta": "Sim_Não", "id_formulario": formulario["id"]
+    }).json()
+    client.post("/opcoes-respostas/", json={"resposta": "Sim", "id_pergunta": pergunta["id"]})
+    client.put(f"/formularios/{formulario['id']}", json={"descricao": "Atualizada depois dos filhos"})
+    return formulario, pergunta
+
+def _segunda_carga(client, formulario, pergunta):
+    motivo = client.post("/perguntas/", json={
+        "titulo": "Por quê?", "tipo_pergunta": "texto_livre", "id_formulario": formulario["id"]
+    }).json()
+    client.post("/opcoes-respostas/", json={"resposta": "Outro", "id_pergunta": motivo["id"]})
+    # A opção cai junto com a pergunta, sem entrada própria no feed
+    assert client.delete(f"/perguntas/{motivo['id']}").status_code == 204
+    client.put(f"/perguntas/{pergunta['id']}", json={"titulo": "Recomendaria a um amigo?"})
+    client.put(f"/formularios/{formulario['id']}", json={"titulo": "Pesquisa v2"})
+
+    descartado = client.post("/formularios/", json={"titulo": "Rascunho"}).json()
+    rascunho = client.post("/perguntas/", json={
+        "titulo": "Temporária", "tipo_pergunta": "Inteiro", "id_formulario": descartado["id"]
+    }).json()
+    client.post("/opcoes-respostas/", json={"resposta": "1", "id_pergunta": rascunho["id"]})
+    assert client.delete(f"/formularios/{descartado['id']}").status_code == 204
+    return descartado
+
+def test_replay_completo_reconstroi_estado(client):
+    formulario, pergunta = _primeira_carga(client)
+    _segunda_carga(client, formulario, pergunta)
+
+    replica = Replica()
+    replica.sincronizar(client)
+    assert replica.entidades == _estado_servidor()
+
+def test_replay_apos_compactacao_entrega_pais_antes_dos_filhos(client):
+    formulario, pergunta = _primeira_carga(client)
+    _segunda_carga(client, formulario, pergunta)
+    assert _compactar(_ultimo_seq()) > 0
+
+    replica = Replica()
+    replica.sincronizar(client)
+    assert replica.entidades == _estado_servidor()
+
+def test_cliente_incremental_apos_compactacao(client):
+    formulario, pergunta = _primeira_carga(client)
+    replica = Replica()
+    replica.sincronizar(client)
+
+    _segunda_carga(client, formulario, pergunta)
+    # Horizonte no cursor do cliente: ele ainda pode continuar de onde parou
+    _compactar(replica.cursor)
+    replica.sincronizar(client)
+    assert replica.entidades == _estado_servidor()
+
+def test_cursor_anterior_ao_horizonte_retorna_410(client):
+    formulario, pergunta = _primeira_carga(client)
+    _segunda_carga(client, formulario, pergunta)
+    _compactar(_ultimo_seq())
+
+    assert client.get("/alteracoes/", params={"desde": 1}).status_code == 410
+    assert client.get("/alteracoes/stream", params={"desde": 1}).status_code == 410
+    assert client.get("/alteracoes/stream", headers={"Last-Event-ID": "1"}).status_code == 410
+    assert client.get("/alteracoes/", params={"desde": 0}).status_code == 200
+
+def test_compactacao_expurga_subarvore_excluida(client):
+    formulario, pergunta = _primeira_carga(client)
+    descartado = _segunda_carga(client, formulario, pergunta)
+    antes = _feed()
+    assert ("formulario", descartado["id"], "deletar") in antes
+
+    assert executar_compactacao(retencao=timedelta(0)) > 0
+    depois = _feed()
+    excluidos = _estado_servidor().keys() ^ {(entidade, id_entidade) for entidade, id_entidade, _ in antes}
+    assert excluidos
+    assert [e for e in depois if (e[0], e[1]) in excluidos] == []
+    # Entidades vivas ficam com a criação e a entrada mais recente
+    assert ("formulario", formulario["id"], "criar") in depois
+    assert sum(1 for e in depois if e[:2] == ("formulario", formulario["id"])) == 2
+
+class RequisicaoFalsa:
+    """O suficiente de ``Request`` para o stream: nunca desconecta"""
+
+    async def is_disconnected(self):
+        return False
+
+async def _ler_eventos(resposta, quantidade):
+    """Ler ``quantidade`` eventos SSE do corpo do stream, ignorando keep-alives"""
+    eventos = []
+    corpo = resposta.body_iterator
+    while len(eventos) < quantidade:
+        bloco = await asyncio.wait_for(corpo.__anext__(), timeout=5)
+        if bloco.startswith(":"):
+            continue
+        campos = dict(linha.split(": ", 1) for linha in bloco.strip().split("\n"))
+        eventos.append({**campos, "data": json.loads(campos["data"])})
+    return eventos
+
+def _abrir_stream(desde=0, last_event_id=None):
+    return rotas_alteracoes.stream_alteracoes(request=RequisicaoFalsa(), desde=desde, last_event_id=last_event_id)
+
+def test_stream_entrega_eventos_e_retoma_com_last_event_id(client):
+    _primeira_carga(client)
+    feed = client.get("/alteracoes/").json()["items"]
+
+    async def cenario():
+        resposta = await _abrir_stream()
+        eventos = await _ler_eventos(resposta, 3)
+        await resposta.body_iterator.aclose()
+
+        retomada = await _abrir_stream(last_event_id=eventos[1]["id"])
+        seguinte = await _ler_eventos(retomada, 1)
+        await retomada.body_iterator.aclose()
+        return eventos, seguinte
+
+    eventos, seguinte = asyncio.run(cenario())
+    assert [evento["event"] for evento in eventos] == ["alteracao"] * 3
+    assert [int(evento["id"]) for evento in eventos] == [alteracao["seq"] for alteracao in feed[:3]]
+    assert [evento["data"] for evento in eventos] == feed[:3]
+    assert seguinte[0]["data"] == feed[2]
+
+def test_streams_compartilham_uma_consulta_ao_vivo(client, monkeypatch):
+    monkeypatch.setattr(rotas_alteracoes, "INTERVALO_STREAM_SEGUNDOS", 0.05)
+    desde = _ultimo_seq()
+
+    async def cenario():
+        streams = [await _abrir_stream(desde=desde) for _ in range(3)]
+        # Os geradores só assinam ao serem iterados pela primeira vez
+        leituras = [asyncio.ensure_future(_ler_eventos(stream, 1)) for stream in streams]
+        while len(rotas_alteracoes.distribuidor.assinaturas) < len(streams):
+            await asyncio.sleep(0.01)
+        tarefa = rotas_alteracoes.distribuidor.tarefa
+
+        await asyncio.to_thread(client.post, "/formularios/", json={"titulo": "Ao vivo"})
+        recebidos = await asyncio.gather(*leituras)
+        assert rotas_alteracoes.distribuidor.tarefa is tarefa
+        for stream in streams:
+            await stream.body_iterator.aclose()
+        return recebidos
+
+    recebidos = asyncio.run(cenario())
+    assert rotas_alteracoes.distribuidor.assinaturas == set()
+    for eventos in recebidos:
+        assert eventos[0]["data"]["entidade"] == "formulario"
+        assert eventos[0]["data"]["dados"]["titulo"] == "Ao vivo"
+        assert int(eventos[0]["id"]) > desde
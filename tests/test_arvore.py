@@ -0,0 +1,116 @@
+from sqlalchemy import event
+from app.database.database import engine
+from tests.test_alteracoes import Replica, _compactar, _estado_servidor, _ultimo_seq
+
+def _criar_formulario(client):
+    formulario = client.post("/formularios/", json={"titulo": "Pesquisa"}).json()
+    resposta = client.patch(f"/formularios/{formulario['id']}/arvore", json={
+        "titulo": "Pesquisa",
+        "perguntas": [
+            {
+                "titulo": "Recomendaria?", "tipo_pergunta": "Sim_Não", "ordem": 1,
+                "opcoes_respostas": [
+                    {"resposta": "Sim", "ordem": 1},
+                    {"resposta": "Não", "ordem": 2, "perguntas_condicionais": [{"ref": "motivo"}]}
+                ]
+            },
+            {"ref": "motivo", "titulo": "Por quê?", "tipo_pergunta": "texto_livre", "ordem": 2}
+        ]
+    })
+    assert resposta.status_code == 200
+    return resposta
+
+def _arvore(formulario):
+    """Montar o payload do PATCH a partir do GET, como faria o editor"""
+    return {
+        "titulo": formulario["titulo"],
+        "descricao": formulario["descricao"],
+        "ordem": formulario["ordem"],
+        "perguntas": [
+            {
+                **{campo: valor for campo, valor in pergunta.items() if campo not in ("id_formulario", "versao")},
+                "opcoes_respostas": [
+                    {campo: valor for campo, valor in opcao.items() if campo not in ("id_pergunta", "versao")}
+                    for opcao in pergunta["opcoes_respostas"]
+                ]
+            }
+            for pergunta in formulario["perguntas"]
+        ]
+    }
+
+def test_arvore_cria_itens_e_resolve_refs(client):
+    resultado = _criar_formulario(client).json()
+    assert len(resultado["perguntas"]["criadas"]) == 2
+    assert len(resultado["opcoes_respostas"]["criadas"]) == 2
+    assert len(resultado["vinculos"]["criadas"]) == 1
+    assert resultado["refs"]["motivo"] in resultado["perguntas"]["criadas"]
+
+def test_arvore_sem_mudancas_nao_escreve(client, comandos):
+    _criar_formulario(client)
+    leitura = client.get("/formularios/1")
+    arvore = _arvore(leitura.json())
+    # Sem vínculos no payload eles seriam removidos; o GET não os devolve
+    arvore["perguntas"][0]["opcoes_respostas"][1]["perguntas_condicionais"] = [{"id": arvore["perguntas"][1]["id"]}]
+    comandos.clear()
+    resposta = client.patch("/formularios/1/arvore", json=arvore, headers={"If-Match": leitura.headers["etag"]})
+    assert resposta.status_code == 200
+    assert resposta.json()["versao"] == leitura.json()["versao"]
+    assert [c for c in comandos if c[0] != "SELECT"] == []
+
+def test_arvore_remove_itens_ausentes(client):
+    _criar_formulario(client)
+    arvore = _arvore(client.get("/formularios/1").json())
+    del arvore["perguntas"][1]
+    resultado = client.patch("/formularios/1/arvore", json=arvore).json()
+    assert len(resultado["perguntas"]["removidas"]) == 1
+    assert len(client.get("/formularios/1").json()["perguntas"]) == 1
+
+def test_escrita_em_filho_invalida_if_match_da_arvore(client):
+    _criar_formulario(client)
+    leitura = client.get("/formularios/1")
+    client.put("/perguntas/1", json={"titulo": "Alterada por outra pessoa"})
+    resposta = client.patch(
+        "/formularios/1/arvore", json=_arvore(leitura.json()), headers={"If-Match": leitura.headers["etag"]}
+    )
+    assert resposta.status_code == 412
+
+def test_arvore_trava_formulario_antes_dos_filhos(client):
+    """Mesma ordem de bloqueio das escritas avulsas, que atualizam o formulário primeiro"""
+    _criar_formulario(client)
+    arvore = _arvore(client.get("/formularios/1").json())
+    arvore["perguntas"][0]["titulo"] = "Editada"
+    executados = []
+
+    def registrar(conexao, cursor, sql, parametros, contexto, executemany):
+        executados.append(" ".join(sql.split()))
+
+    event.listen(engine, "before_cursor_execute", registrar)
+    try:
+        assert client.patch("/formularios/1/arvore", json=arvore).status_code == 200
+    finally:
+        event.remove(engine, "before_cursor_execute", registrar)
+
+    assert executados[0].startswith("SELECT") and "FROM formulario" in executados[0]
+    assert "FROM pergunta" in executados[1]
+    if engine.dialect.name == "postgresql":
+        assert executados[0].endswith("FOR UPDATE")
+        assert executados[1].endswith("FOR UPDATE")
+    primeira_escrita = next(sql for sql in executados if not sql.startswith("SELECT"))
+    assert primeira_escrita.startswith("UPDATE pergunta")
+
+def test_replay_do_feed_reconstroi_arvore_com_vinculos(client):
+    _criar_formulario(client)
+    arvore = _arvore(client.get("/formularios/1").json())
+    # A pergunta condicional sai; o vínculo cai junto, sem entrada própria no feed
+    del arvore["perguntas"][1]
+    arvore["perguntas"].append({"ref": "idade", "titulo": "Idade", "tipo_pergunta": "Inteiro"})
+    arvore["perguntas"][0]["opcoes_respostas"][0]["perguntas_condicionais"] = [{"ref": "idade"}]
+    assert client.patch("/formularios/1/arvore", json=arvore).status_code == 200
+
+    for compactar in (False, True):
+        if compactar:
+            _compactar(_ultimo_seq())
+        replica = Replica()
+        replica.sincronizar(client)
+        assert replica.entidades == _estado_servidor()
+        assert [chave for chave in replica.entidades if chave[0] == "opcao_resposta_pergunta"] != []
@@ -0,0 +1,66 @@
+import statistics
+import time
+import pytest
+from tests.test_arvore import _arvore
+from tests.test_escritas import _com_feed
+
+QUANTIDADE_PERGUNTAS = 500
+OPCOES_POR_PERGUNTA = 2
+REPETICOES = 5
+# Folga larga sobre os ~100 ms medidos, para não falhar por ruído da máquina
+LIMITE_MS = 1000
+
+def _criar_formulario_grande(client):
+    formulario = client.post("/formularios/", json={"titulo": "Censo"}).json()
+    resposta = client.patch(f"/formularios/{formulario['id']}/arvore", json={
+        "titulo": "Censo",
+        "perguntas": [
+            {
+                "titulo": f"Pergunta {numero}", "tipo_pergunta": "Sim_Não", "ordem": numero,
+                "opcoes_respostas": [
+                    {"resposta": f"Opção {opcao}", "ordem": opcao} for opcao in range(OPCOES_POR_PERGUNTA)
+                ]
+            }
+            for numero in range(QUANTIDADE_PERGUNTAS)
+        ]
+    })
+    assert resposta.status_code == 200
+    return client.get(f"/formularios/{formulario['id']}")
+
+def test_editar_um_campo_em_formulario_de_500_perguntas(client, comandos):
+    leitura = _criar_formulario_grande(client)
+    formulario = leitura.json()
+    arvore = _arvore(formulario)
+    arvore["perguntas"][250]["titulo"] = "Pergunta editada"
+
+    comandos.clear()
+    resposta = client.patch(
+        f"/formularios/{formulario['id']}/arvore", json=arvore, headers={"If-Match": leitura.headers["etag"]}
+    )
+
+    assert resposta.status_code == 200
+    assert resposta.json()["perguntas"]["atualizadas"] == [formulario["perguntas"][250]["id"]]
+    # Quatro leituras da árvore, um UPDATE na pergunta, a versão do formulário e o feed
+    assert comandos == _com_feed(
+        *[("SELECT", None)] * 4, ("UPDATE", "pergunta"), ("UPDATE", "formulario")
+    )
+
+@pytest.mark.benchmark
+def test_benchmark_editar_um_campo_em_formulario_de_500_perguntas(client, record_property):
+    leitura = _criar_formulario_grande(client)
+    formulario = leitura.json()
+    arvore = _arvore(formulario)
+    versao = leitura.headers["etag"]
+
+    duracoes = []
+    for repeticao in range(REPETICOES):
+        arvore["perguntas"][250]["titulo"] = f"Pergunta editada {repeticao}"
+        inicio = time.perf_counter()
+        resposta = client.patch(f"/formularios/{formulario['id']}/arvore", json=arvore, headers={"If-Match": versao})
+        duracoes.append((time.perf_counter() - inicio) * 1000)
+        assert resposta.status_code == 200
+        versao = resposta.headers["etag"]
+
+    mediana = statistics.median(duracoes)
+    record_property("duracao_ms", round(mediana, 1))
+    assert mediana < LIMITE_MS
@@ -0,0 +1,112 @@
+import pytest
+from app.database.database import engine
+
+def _criar_arvore(client):
+    formulario = client.post("/formularios/", json={"titulo": "Pesquisa"}).json()
+    pergunta = client.post("/perguntas/", json={
+        "titulo": "Recomendaria?", "tipo_pergunta": "Sim_Não", "id_formulario": formulario["id"]
+    }).json()
+    opcao = client.post("/opcoes-respostas/", json={"resposta": "Sim", "id_pergunta": pergunta["id"]}).json()
+    return formulario, pergunta, opcao
+
+def _com_feed(*comandos):
+    """Comandos da escrita seguidos do registro no feed (lock só no PostgreSQL)"""
+    lock = [("LOCK", None)] if engine.dialect.name == "postgresql" else []
+    return [*comandos, *lock, ("INSERT", "alteracoes")]
+
+def test_criar_formulario(client, comandos):
+    resposta = client.post("/formularios/", json={"titulo": "Pesquisa"})
+    assert resposta.status_code == 201
+    assert resposta.headers["etag"] == '"1"'
+    assert comandos == _com_feed(("INSERT", "formulario"))
+
+@pytest.mark.parametrize("url, corpo, tabela", [
+    ("/perguntas/", {"titulo": "P", "tipo_pergunta": "Inteiro"}, "pergunta"),
+    ("/opcoes-respostas/", {"resposta": "R"}, "opcoes_respostas"),
+])
+def test_criar_filho_trava_formulario_antes(client, comandos, url, corpo, tabela):
+    formulario, pergunta, _ = _criar_arvore(client)
+    corpo = {**corpo, "id_formulario": formulario["id"], "id_pergunta": pergunta["id"]}
+    comandos.clear()
+    resposta = client.post(url, json=corpo)
+    assert resposta.status_code == 201
+    assert comandos == _com_feed(("UPDATE", "formulario"), ("INSERT", tabela))
+
+@pytest.mark.parametrize("url, corpo, detalhe", [
+    ("/perguntas/", {"titulo": "P", "tipo_pergunta": "Inteiro", "id_formulario": 999}, "Formulário não encontrado"),
+    ("/opcoes-respostas/", {"resposta": "R", "id_pergunta": 999}, "Pergunta não encontrada"),
+])
+def test_criar_com_pai_inexistente_retorna_404(client, comandos, url, corpo, detalhe):
+    resposta = client.post(url, json=corpo)
+    assert resposta.status_code == 404
+    assert resposta.json()["detail"] == detalhe
+    assert comandos == [("UPDATE", "formulario")]
+
+@pytest.mark.parametrize("recurso, corpo, esperados", [
+    # Perguntas e opções da resposta: um SELECT por nível
+    ("formularios", {"titulo": "Novo"}, [("UPDATE", "formulario"), ("SELECT", None), ("SELECT", None)]),
+    ("perguntas", {"titulo": "Novo"}, [("UPDATE", "formulario"), ("UPDATE", "pergunta"), ("SELECT", None)]),
+    ("opcoes-respostas", {"resposta": "Novo"}, [("UPDATE", "formulario"), ("UPDATE", "opcoes_respostas")]),
+])
+def test_atualizar(client, comandos, recurso, corpo, esperados):
+    _criar_arvore(client)
+    versao = client.get(f"/{recurso}/1").json()["versao"]
+    comandos.clear()
+    resposta = client.put(f"/{recurso}/1", json=corpo)
+    assert resposta.status_code == 200
+    assert resposta.json()["versao"] == versao + 1
+    assert resposta.headers["etag"] == f'"{versao + 1}"'
+    assert comandos == _com_feed(*esperados)
+
+def test_atualizar_retorna_filhos(client):
+    _, pergunta, opcao = _criar_arvore(client)
+    formulario = client.put("/formularios/1", json={"titulo": "Novo"}).json()
+    assert [p["id"] for p in formulario["perguntas"]] == [pergunta["id"]]
+    assert [o["id"] for o in formulario["perguntas"][0]["opcoes_respostas"]] == [opcao["id"]]
+    resposta = client.put(f"/perguntas/{pergunta['id']}", json={"titulo": "Novo"}).json()
+    assert [o["id"] for o in resposta["opcoes_respostas"]] == [opcao["id"]]
+
+@pytest.mark.parametrize("recurso, esperados", [
+    ("opcoes-respostas", [("UPDATE", "formulario"), ("DELETE", "opcoes_respostas")]),
+    ("perguntas", [("UPDATE", "formulario"), ("DELETE", "pergunta")]),
+    ("formularios", [("DELETE", "formulario")]),
+])
+def test_deletar(client, comandos, recurso, esperados):
+    _criar_arvore(client)
+    comandos.clear()
+    assert client.delete(f"/{recurso}/1").status_code == 204
+    assert comandos == _com_feed(*esperados)
+    assert client.get(f"/{recurso}/1").status_code == 404
+
+def test_deletar_inexistente_retorna_404_com_um_comando(client, comandos):
+    assert client.delete("/perguntas/999").status_code == 404
+    assert comandos == [("UPDATE", "formulario")]
+
+def test_deletar_formulario_remove_filhos(client):
+    _, pergunta, opcao = _criar_arvore(client)
+    assert client.delete("/formularios/1").status_code == 204
+    assert client.get(f"/perguntas/{pergunta['id']}").status_code == 404
+    assert client.get(f"/opcoes-respostas/{opcao['id']}").status_code == 404
+
+def test_if_match_desatualizado_retorna_412(client):
+    _criar_arvore(client)
+    assert client.put("/perguntas/1", json={"titulo": "A"}, headers={"If-Match": '"1"'}).status_code == 200
+    resposta = client.put("/perguntas/1", json={"titulo": "B"}, headers={"If-Match": '"1"'})
+    assert resposta.status_code == 412
+    assert client.delete("/perguntas/1", headers={"If-Match": '"1"'}).status_code == 412
+    assert client.get("/perguntas/1").json()["titulo"] == "A"
+
+def test_if_match_de_entidade_inexistente_retorna_404(client):
+    assert client.put("/perguntas/999", json={"titulo": "A"}, headers={"If-Match": '"1"'}).status_code == 404
+
+def test_if_match_invalido_retorna_400(client):
+    _criar_arvore(client)
+    assert client.put("/perguntas/1", json={"titulo": "A"}, headers={"If-Match": "abc"}).status_code == 400
+
+def test_escrita_em_filho_muda_etag_do_formulario(client):
+    _criar_arvore(client)
+    etag = client.get("/formularios/1").headers["etag"]
+    client.put("/opcoes-respostas/1", json={"resposta": "Talvez"})
+    resposta = client.get("/formularios/1")
+    assert resposta.headers["etag"] != etag
+    assert resposta.headers["etag"] == f'"{resposta.json()["versao"]}"'
@@ -0,0 +1,72 @@
+import os
+import tempfile
+from sqlalchemy import create_engine, event, text
+from app.database.database import Base
+from app.database.migracoes import atualizar_esquema
+
+# Esquema gerado pelo create_all antes das colunas de versão, do ON DELETE
+# CASCADE e do AUTOINCREMENT
+ESQUEMA_ANTIGO = [
+    """CREATE TABLE formulario (
+        id INTEGER NOT NULL, titulo VARCHAR NOT NULL, descricao VARCHAR, ordem INTEGER,
+        PRIMARY KEY (id)
+    )""",
+    """CREATE TABLE pergunta (
+        id INTEGER NOT NULL, id_formulario INTEGER NOT NULL, titulo VARCHAR NOT NULL, codigo VARCHAR,
+        orientacao_resposta VARCHAR, ordem INTEGER, obrigatoria BOOLEAN, sub_pergunta BOOLEAN,
+        tipo_pergunta VARCHAR(16) NOT NULL,
+        PRIMARY KEY (id), FOREIGN KEY(id_formulario) REFERENCES formulario (id)
+    )""",
+    """CREATE TABLE opcoes_respostas (
+        id INTEGER NOT NULL, id_pergunta INTEGER NOT NULL, resposta VARCHAR NOT NULL, ordem INTEGER,
+        resposta_aberta BOOLEAN,
+        PRIMARY KEY (id), FOREIGN KEY(id_pergunta) REFERENCES pergunta (id)
+    )""",
+    """CREATE TABLE opcoes_resposta_pergunta (
+        id INTEGER NOT NULL, id_opcao_resposta INTEGER NOT NULL, id_pergunta INTEGER NOT NULL,
+        PRIMARY KEY (id), FOREIGN KEY(id_opcao_resposta) REFERENCES opcoes_respostas (id),
+        FOREIGN KEY(id_pergunta) REFERENCES pergunta (id)
+    )""",
+    "INSERT INTO formulario (id, titulo) VALUES (1, 'Pesquisa'), (2, 'Outra')",
+    "INSERT INTO pergunta (id, id_formulario, titulo, tipo_pergunta) VALUES (1, 1, 'P', 'INTEIRO')",
+    "INSERT INTO opcoes_respostas (id, id_pergunta, resposta) VALUES (1, 1, 'Sim')",
+    "INSERT INTO opcoes_resposta_pergunta (id, id_opcao_resposta, id_pergunta) VALUES (1, 1, 1)",
+]
+
+def _engine_sqlite_antigo():
+    engine = create_engine(f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'antigo.db')}")
+
+    @event.listens_for(engine, "connect")
+    def ativar_chaves_estrangeiras(conexao_dbapi, _):
+        conexao_dbapi.execute("PRAGMA foreign_keys=ON")
+
+    with engine.begin() as conexao:
+        for comando in ESQUEMA_ANTIGO:
+            conexao.execute(text(comando))
+    return engine
+
+def test_sqlite_antigo_passa_a_excluir_em_cascata():
+    engine = _engine_sqlite_antigo()
+    Base.metadata.create_all(bind=engine)
+    atualizar_esquema(engine)
+
+    with engine.begin() as conexao:
+        assert conexao.execute(text("SELECT versao FROM pergunta WHERE id = 1")).scalar() == 1
+        conexao.execute(text("DELETE FROM formulario WHERE id = 1"))
+    with engine.connect() as conexao:
+        assert conexao.execute(text("SELECT count(*) FROM pergunta")).scalar() == 0
+        assert conexao.execute(text("SELECT count(*) FROM opcoes_respostas")).scalar() == 0
+        assert conexao.execute(text("SELECT count(*) FROM opcoes_resposta_pergunta")).scalar() == 0
+        assert conexao.execute(text("SELECT titulo FROM formulario")).scalars().all() == ["Outra"]
+
+def test_sqlite_migrado_nao_reaproveita_ids():
+    engine = _engine_sqlite_antigo()
+    Base.metadata.create_all(bind=engine)
+    atualizar_esquema(engine)
+    # Migrar de novo não deve fazer nada
+    atualizar_esquema(engine)
+
+    with engine.begin() as conexao:
+        conexao.execute(text("DELETE FROM formulario WHERE id = 2"))
+        novo = conexao.execute(text("INSERT INTO formulario (titulo) VALUES ('Nova') RETURNING id")).scalar()
+    assert novo == 3